@@ -0,0 +1,135 @@
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import columnar
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SEP = ';'
+ELEMENT_COLUMNS = ['Element Name', 'Element U-Value']
+# The columns of an elements.csv row; the materials of its component repeat them in consecutive rows of totem_data.csv
+LAYER_COLUMNS = ELEMENT_COLUMNS + ['Layer', 'Composition', 'Ratio', 'Component Name', 'Application', 'Lifetime', 'Thickness']
+UNIT_COLUMN = 'Functional Unit'
+# Thickness is only a thickness for components per m², for the others param1 is e.g. a section, a count or a power
+AREA_UNIT = 'sqm'
+DENSITY_COLUMNS = ['Min Density', 'Max Density']
+END_OF_LIFE_COLUMNS = ['Landfill', 'Incineration', 'Reuse', 'Recycling', 'Sorted on Building Site']
+NUMBER_COLUMNS = ['Element U-Value', 'Ratio', 'Lifetime', 'Thickness'] + DENSITY_COLUMNS + END_OF_LIFE_COLUMNS
+
+ELEMENTS_OUTPUT = 'element_end_of_life.csv'
+LAYERS_OUTPUT = 'layer_end_of_life.csv'
+
+def read_data(path):
+    if path.endswith('.parquet'):
+        frame = columnar.read_frame(path)[LAYER_COLUMNS + [UNIT_COLUMN] + DENSITY_COLUMNS + END_OF_LIFE_COLUMNS]
+    else:
+        frame = pd.read_csv(path, sep=SEP, usecols=LAYER_COLUMNS + [UNIT_COLUMN] + DENSITY_COLUMNS + END_OF_LIFE_COLUMNS)
+    for column in NUMBER_COLUMNS:
+        # e.g. 'Not available' in Sorted on Building Site
+        frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    return frame
+
+def run_ids(frame, columns):
+    # Consecutive rows with the same values share an id, counting up from 0; also returns the first row of every run
+    codes = np.column_stack([pd.factorize(frame[column])[0] for column in columns])
+    starts = np.ones(len(frame), dtype=bool)
+    starts[1:] = (codes[1:] != codes[:-1]).any(axis=1)
+    return np.cumsum(starts) - 1, np.flatnonzero(starts)
+
+def group_sum(ids, values, count):
+    return np.bincount(ids, weights=values, minlength=count)
+
+def divide(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+def aggregate(frame):
+    # Layers are the runs of rows of one elements.csv row, elements the runs of rows of one element
+    layer_ids, layer_starts = run_ids(frame, LAYER_COLUMNS)
+    element_ids, element_starts = run_ids(frame, ELEMENT_COLUMNS)
+    layer_count = len(layer_starts)
+    element_count = len(element_starts)
+
+    # Without material shares in the data, the materials of a component count as equal parts of its layer
+    fractions = frame[END_OF_LIFE_COLUMNS].to_numpy(dtype=float)
+    has_fractions = ~np.isnan(fractions[:, 0])
+    materials = group_sum(layer_ids, has_fractions.astype(float), layer_count)
+    layer_fractions = np.column_stack([
+        divide(group_sum(layer_ids, np.where(has_fractions, fractions[:, k], 0.0), layer_count), materials)
+        for k in range(len(END_OF_LIFE_COLUMNS))
+    ])
+
+    # Per m² of element: the volume of a layer is its share of the element's area times its thickness. Layers of
+    # components with another functional unit have no volume or mass and are left out of the weighting.
+    first = frame.iloc[layer_starts]
+    units = first[UNIT_COLUMN].astype(object).to_numpy()
+    per_area = units == AREA_UNIT
+    excluded = ~per_area & pd.notna(units)
+    volume = np.where(per_area, first['Ratio'].to_numpy(dtype=float) * first['Thickness'].to_numpy(dtype=float), np.nan)
+    min_density = first['Min Density'].to_numpy(dtype=float)
+    max_density = first['Max Density'].to_numpy(dtype=float)
+    min_mass = volume * min_density
+    max_mass = volume * max_density
+    layer_elements = element_ids[layer_starts]
+
+    layers = first[LAYER_COLUMNS + [UNIT_COLUMN]].reset_index(drop=True)
+    layers['Volume'] = volume
+    layers['Min Density'] = min_density
+    layers['Max Density'] = max_density
+    layers['Min Mass'] = min_mass
+    layers['Max Mass'] = max_mass
+    layers['Materials'] = materials.astype(int)
+    for k, column in enumerate(END_OF_LIFE_COLUMNS):
+        layers[column] = layer_fractions[:, k]
+
+    known_volume = np.nan_to_num(volume)
+    has_mass = ~np.isnan(min_mass) & ~np.isnan(max_mass)
+    element_volume = group_sum(layer_elements, known_volume, element_count)
+    mass_volume = group_sum(layer_elements, np.where(has_mass, known_volume, 0.0), element_count)
+    element_min_mass = group_sum(layer_elements, np.where(has_mass, min_mass, 0.0), element_count)
+    element_max_mass = group_sum(layer_elements, np.where(has_mass, max_mass, 0.0), element_count)
+
+    # Fractions are weighted by mass (the middle of the density range) over the layers with a density. An element
+    # without any density is weighted by volume instead, layers without fractions count for neither.
+    by_mass = group_sum(layer_elements, has_mass.astype(float), element_count) > 0
+    weights = np.where(by_mass[layer_elements], np.where(has_mass, (min_mass + max_mass) / 2, 0.0), known_volume)
+    weights = np.where(materials > 0, weights, 0.0)
+    weight_totals = group_sum(layer_elements, weights, element_count)
+    excluded_layers = np.bincount(layer_elements, weights=excluded & (materials > 0), minlength=element_count).astype(int)
+
+    layers['Weighting'] = np.where(weights > 0, np.where(by_mass[layer_elements], 'mass', 'volume'),
+                                   np.where(excluded, 'left out (per ' + units.astype(str) + ')', 'none'))
+
+    elements = frame.iloc[element_starts][ELEMENT_COLUMNS].reset_index(drop=True)
+    elements['Layers'] = np.bincount(layer_elements, minlength=element_count)
+    elements['Volume'] = element_volume
+    elements['Min Mass'] = np.where(by_mass, element_min_mass, np.nan)
+    elements['Max Mass'] = np.where(by_mass, element_max_mass, np.nan)
+    elements['Min Density'] = divide(element_min_mass, mass_volume)
+    elements['Max Density'] = divide(element_max_mass, mass_volume)
+    elements['Mass Coverage'] = divide(mass_volume, element_volume)
+    weighting = pd.Series(np.where(by_mass, 'mass', np.where(weight_totals > 0, 'volume', 'none')))
+    excluded_note = ' (' + pd.Series(excluded_layers).astype(str) + np.where(excluded_layers == 1, ' layer', ' layers') + ' not per m² left out)'
+    elements['Weighting'] = weighting.where(excluded_layers == 0, weighting + excluded_note)
+    for k, column in enumerate(END_OF_LIFE_COLUMNS):
+        elements[column] = divide(group_sum(layer_elements, weights * np.nan_to_num(layer_fractions[:, k]), element_count), weight_totals)
+    return elements, layers
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll the merged data up into end-of-life fractions and masses per element and per layer")
+    parser.add_argument('--input', default='totem_data.csv', help="output of merge.py, CSV or Parquet")
+    parser.add_argument('--elements-output', default=ELEMENTS_OUTPUT)
+    parser.add_argument('--layers-output', default=LAYERS_OUTPUT)
+    args = parser.parse_args()
+
+    elements, layers = aggregate(read_data(args.input))
+    elements.to_csv(args.elements_output, index=False, sep=SEP)
+    layers.to_csv(args.layers_output, index=False, sep=SEP)
+    logging.info(f"Wrote {len(elements)} elements to {args.elements_output} ({(elements['Weighting'] == 'mass').sum()} weighted by mass) "
+                 f"and {len(layers)} layers to {args.layers_output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import traceback
+
+import scrape
+import replay
+import totem_http
+from scrape import LIBRARIES
+
+# A local server needs neither images nor the remaining page resources, and no login
+BENCHMARK_BROWSER = {
+    'headless': True,
+    'block_assets': True,
+    'page_load_strategy': 'eager',
+    'session_cache': None
+}
+
+def run_library(kind, engine, sessions, workers):
+    start = time.perf_counter()
+    if engine == 'browser':
+        summary = scrape.scrape_library(kind, sessions, fresh=True)
+    else:
+        summary = totem_http.scrape_library(kind, [], workers, fresh=True)
+    elapsed = time.perf_counter() - start
+    if summary is None:
+        raise RuntimeError(f"No {kind} were scraped from the replay")
+
+    return {
+        'kind': kind,
+        'engine': engine,
+        'workers': workers,
+        'items': summary['items'],
+        'failed': summary['failed'],
+        'pane_timeouts': summary['pane_timeouts'],
+        'seconds': elapsed,
+        'items_per_second': summary['items'] / elapsed,
+        'latency': {name: value for name, value in summary['seconds'].items() if name != 'total'},
+        'phases': {name: values['total'] for name, values in summary['phases'].items()},
+        'commands_p50': summary['commands']['p50']
+    }
+
+def run_benchmark(fixtures, kinds, engine='browser', workers=1, repeat=1, browser=BENCHMARK_BROWSER):
+    server = replay.serve(os.path.abspath(fixtures), 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = scrape.BASE_URL
+    scrape.BASE_URL = f"http://127.0.0.1:{server.server_port}"
+
+    sessions = []
+    results = []
+    working_directory = os.getcwd()
+    try:
+        if engine == 'browser':
+            sessions = [scrape.create_driver(browser) for _ in range(workers)]
+        # Outputs, journals and metrics of the runs are thrown away with the directory
+        with tempfile.TemporaryDirectory() as output:
+            os.chdir(output)
+            for run in range(repeat):
+                for kind in kinds:
+                    result = run_library(kind, engine, sessions, workers)
+                    result['run'] = run + 1
+                    results.append(result)
+                    report(result)
+            os.chdir(working_directory)
+    finally:
+        os.chdir(working_directory)
+        for driver in sessions:
+            driver.quit()
+        scrape.BASE_URL = base_url
+        server.shutdown()
+        server.server_close()
+    return results
+
+def report(result):
+    latency = result['latency']
+    logging.info(f"{result['kind']} ({result['engine']}, {result['workers']} workers, run {result['run']}): "
+                 f"{result['items']} items in {result['seconds']:.2f}s, {result['items_per_second']:.2f} items/s, "
+                 f"latency p50 {latency['p50']:.3f}s, p90 {latency['p90']:.3f}s, p99 {latency['p99']:.3f}s, max {latency['max']:.3f}s, "
+                 f"{result['failed']} failed, {result['pane_timeouts']} pane timeouts")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers offline against pages recorded with `replay.py --record`")
+    parser.add_argument('--fixtures', default='fixtures', help="recorded pages and panes, partial responses for `--engine http`")
+    parser.add_argument('--engine', choices=['browser', 'http'], default='browser')
+    parser.add_argument('--kinds', nargs='+', choices=list(LIBRARIES), default=list(LIBRARIES))
+    parser.add_argument('--workers', type=int, default=1, help="number of browser sessions or HTTP workers")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per library")
+    parser.add_argument('--headed', action='store_true', help="show the browser window")
+    parser.add_argument('--output', help="JSON file to save the results to")
+    args = parser.parse_args()
+
+    try:
+        results = run_benchmark(args.fixtures, args.kinds, args.engine, args.workers, args.repeat, dict(BENCHMARK_BROWSER, headless=not args.headed))
+    except Exception as e:
+        logging.error(f"Benchmark failed: {e}")
+        traceback.print_exc()
+        raise SystemExit(1)
+
+    if args.output:
+        with open(args.output, mode='w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import os
+import csv
+import logging
+import argparse
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from store import number
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SEP = ';'
+# Rows buffered before they are written out as one row group
+ROW_GROUP_SIZE = 5000
+
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+# Declared types of the columns of elements.csv, components.csv and totem_data.csv, any other column is a string.
+# Repeated labels are dictionary encoded; percentages are stored as fractions and 'Not available' as null.
+COLUMN_TYPES = {
+    'Element U-Value': pa.float64(),
+    'Layer': CATEGORY,
+    'Composition': CATEGORY,
+    'Ratio': pa.float64(),
+    'Component Name': CATEGORY,
+    'Application': CATEGORY,
+    'Lifetime': pa.float64(),
+    'Thickness': pa.float64(),
+    'Category': CATEGORY,
+    'Type': CATEGORY,
+    'Database': CATEGORY,
+    'Lambda': pa.float64(),
+    'R-Value': pa.float64(),
+    'U-Value': pa.float64(),
+    'Min Density': pa.float64(),
+    'Max Density': pa.float64(),
+    'Functional Unit': CATEGORY,
+    'Type of Assembly': CATEGORY,
+    'Waste Category': CATEGORY,
+    'Landfill': pa.float64(),
+    'Incineration': pa.float64(),
+    'Reuse': pa.float64(),
+    'Recycling': pa.float64(),
+    'Sorted on Building Site': pa.float64()
+}
+
+def schema_for(columns):
+    return pa.schema([pa.field(column, COLUMN_TYPES.get(column, pa.string())) for column in columns])
+
+def parquet_path(path):
+    return f"{os.path.splitext(path)[0]}.parquet"
+
+def text(value):
+    if value is None or value == '':
+        return None
+    return str(value)
+
+def rows_to_table(rows, schema):
+    # Rows as written to the CSV, with numbers as numbers (scraper) or as strings (a CSV read back)
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = []
+    for field, values in zip(schema, columns):
+        convert = number if pa.types.is_floating(field.type) else text
+        arrays.append(pa.array([convert(value) for value in values], type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+# Writes rows to a Parquet file in row groups, next to the CSV the same rows go to. The file only appears under its
+# name once closed, a run that stops early leaves no truncated file behind.
+class ParquetWriter:
+    def __init__(self, path, columns, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.temporary_path = f"{path}.tmp"
+        self.schema = schema_for(columns)
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.writer = pq.ParquetWriter(self.temporary_path, self.schema)
+
+    def add_rows(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def add_csv(self, path):
+        # Rows a resumed run already has in its CSV
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.reader(file, delimiter=SEP)
+            next(reader, None)
+            for row in reader:
+                self.add_rows([row])
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(rows_to_table(self.rows, self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.temporary_path, self.path)
+
+def read_frame(path):
+    return pq.read_table(path).to_pandas()
+
+def write_frame(frame, path):
+    table = pa.Table.from_pandas(frame, schema=schema_for(list(frame.columns)), preserve_index=False)
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+
+def convert(path, row_group_size=ROW_GROUP_SIZE):
+    with open(path, newline='', encoding='utf-8') as file:
+        columns = next(csv.reader(file, delimiter=SEP), [])
+    writer = ParquetWriter(parquet_path(path), columns, row_group_size)
+    writer.add_csv(path)
+    writer.close()
+    logging.info(f"Wrote {writer.path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert scraped or merged CSV files to Parquet with typed columns")
+    parser.add_argument('paths', nargs='+', help="e.g. elements.csv components.csv totem_data.csv")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    for path in args.paths:
+        convert(path, args.row_group_size)
+
+if __name__ == '__main__':
+    main()
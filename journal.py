@@ -0,0 +1,143 @@
+import os
+import json
+import logging
+
+# Append-only progress log next to an output CSV. Every line records one finished list item by its index, label and
+# list fingerprint, the (name, application) keys of the rows it produced and the size of the output right after those
+# rows were written. The rows of an item are therefore the bytes between the previous entry's offset and its own.
+class Journal:
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.path = f"{output_path}.journal"
+        self.file = None
+
+    def load(self):
+        header = None
+        entries = []
+        finished = False
+        if not os.path.isfile(self.path):
+            return header, entries, finished
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut off by a crash is the last one, everything before it is intact
+                    break
+                if 'header' in entry:
+                    header = entry['header']
+                elif entry.get('finished'):
+                    finished = True
+                else:
+                    entries.append(entry)
+        return header, entries, finished
+
+    def is_finished(self):
+        return self.load()[2]
+
+    def start(self, items, fresh=False):
+        header, entries, finished = self.load()
+        if fresh or finished or header is None or not os.path.isfile(self.output_path):
+            self.file = open(self.path, mode='w')
+            return {}
+
+        done = {}
+        unmatched = {}
+        for entry in entries:
+            if entry['index'] < len(items) and items[entry['index']]['label'] == entry['label']:
+                done[entry['index']] = entry
+            else:
+                unmatched.setdefault(entry['label'], []).append(entry)
+        # Items that moved in the list since the interrupted run are matched by their label
+        for i, item in enumerate(items):
+            if i not in done and unmatched.get(item['label']):
+                done[i] = unmatched[item['label']].pop(0)
+
+        if not done:
+            self.file = open(self.path, mode='w')
+            return {}
+
+        # Only the rows of the matched items are kept, at their new positions. Items that left the list and rows written
+        # after the last journaled item, which belong to an item that did not finish, are dropped.
+        self.rewrite({entry['index']: i for i, entry in done.items()})
+
+        logging.info(f"Resuming {self.output_path}: {len(done)} of {len(items)} items already scraped")
+        self.file = open(self.path, mode='a')
+        return done
+
+    def rewrite(self, moves=None):
+        # Writes the output again with the rows of its journaled items in list order, and a journal pointing at them.
+        # Items are journaled in the order they were written, which with several shards is not the list order. moves
+        # maps the index an item was journaled with to its index in the current list, items it leaves out are dropped
+        # with their rows; by default every item keeps its index.
+        header, entries, finished = self.load()
+        with open(self.output_path, mode='rb') as file:
+            content = file.read()
+        segments = {}
+        start = header['offset']
+        for entry in entries:
+            index = entry['index'] if moves is None else moves.get(entry['index'])
+            if index is not None:
+                segments[index] = (entry, content[start:entry['offset']])
+            start = entry['offset']
+
+        self.close()
+        temporary_output = f"{self.output_path}.tmp"
+        temporary_journal = f"{self.path}.tmp"
+        with open(temporary_output, mode='wb') as output, open(temporary_journal, mode='w') as journal:
+            output.write(content[:header['offset']])
+            journal.write(json.dumps({'header': header}) + '\n')
+            for index in sorted(segments):
+                entry, rows = segments[index]
+                output.write(rows)
+                journal.write(json.dumps({'index': index, 'label': entry['label'], 'fingerprint': entry['fingerprint'], 'keys': entry['keys'], 'offset': output.tell()}) + '\n')
+        os.replace(temporary_output, self.output_path)
+        os.replace(temporary_journal, self.path)
+        self.file = open(self.path, mode='a')
+
+    def begin(self, offset):
+        # Size of the output once its column header is written, the truncation point if no item finished yet
+        self.write({'header': {'output': self.output_path, 'offset': offset}})
+
+    def record(self, index, item, keys, offset):
+        # Buffered, the writer flushes once per batch after the batch's rows reached the output
+        self.file.write(json.dumps({'index': index, 'label': item['label'], 'fingerprint': item['fingerprint'], 'keys': keys, 'offset': offset}) + '\n')
+
+    def flush(self):
+        self.file.flush()
+
+    def finish(self):
+        self.write({'finished': True})
+        self.close()
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def rotate(self, suffix='.previous'):
+        # Keeps a finished run as the baseline of an incremental run, also across interruptions of that run
+        previous = Journal(f"{self.output_path}{suffix}")
+        os.replace(self.output_path, previous.output_path)
+        os.replace(self.path, previous.path)
+        return previous
+
+    def items(self):
+        # Finished items of this run by label, each with the raw output rows it produced
+        header, entries, finished = self.load()
+        if header is None or not os.path.isfile(self.output_path):
+            return {}
+        with open(self.output_path, mode='rb') as file:
+            content = file.read()
+
+        items = {}
+        start = header['offset']
+        for entry in entries:
+            entry['content'] = content[start:entry['offset']]
+            start = entry['offset']
+            items.setdefault(entry['label'], []).append(entry)
+        return items
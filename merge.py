@@ -1,28 +1,432 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import argparse
+
 import pandas as pd
 
+import store
+import columnar
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
 SEP = ';'
+KEYS = ['Component Name', 'Application']
+# Element rows read, matched and written at a time by --streaming
+CHUNK_SIZE = 10000
+# Content hashes of the inputs of the last --incremental merge and where their rows ended up in totem_data.csv
+STATE_PATH = 'totem_data.csv.state.json'
+
+# What pandas' python parser turns a column into, given the values it holds (missing values aside)
+INTEGER = re.compile(r"[+-]?\d+")
+FLOAT = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?(inf|Inf|INF|infinity|Infinity)")
+BOOLEANS = {'True': True, 'TRUE': True, 'true': True, 'False': False, 'FALSE': False, 'false': False}
+
+def read_input(path, file_format):
+    if file_format == 'parquet':
+        frame = columnar.read_frame(path)
+        # Dictionary encoded keys of the two tables have different categories, they are joined as plain values
+        for key in KEYS:
+            frame[key] = frame[key].astype(object)
+        return frame
+    return pd.read_csv(path, sep=SEP, engine='python')
+
+def write_output(frame, name, file_format):
+    if file_format == 'parquet':
+        columnar.write_frame(frame, f"{name}.parquet")
+    else:
+        frame.to_csv(f"{name}.csv", index=False, sep=SEP)
+
+def write_densities(components, file_format='csv'):
+    densities = components[components['Min Density'].notnull()]
+    write_output(densities, 'components_with_densities', file_format)
+
+def merge(elements_path, components_path, file_format='csv'):
+    df1 = read_input(elements_path, file_format)
+    df2 = read_input(components_path, file_format)
+
+    write_densities(df2, file_format)
+
+    # duplicated_elements = df1.groupby(['Element Name', 'Layer', 'Component Name', 'Application']).size().reset_index(name='match_count')
+    # duplicated_elements = duplicated_elements[duplicated_elements['match_count'] > 1]
+    # if not duplicated_elements.empty:
+    #     raise ValueError(f"Found duplicated elements: {duplicated_elements}")
+
+    # duplicated_components = df2.groupby(['Component Name', 'Application', 'LCI-ID', 'Material']).size().reset_index(name='match_count')
+    # duplicated_components = duplicated_components[duplicated_components['match_count'] > 1]
+    # if not duplicated_components.empty:
+    #     raise ValueError(f"Found duplicated components: {duplicated_components}")
+
+    merged_df = pd.merge(df1, df2, on=KEYS, how='left', indicator=True)
+
+    unmatched_df = merged_df[merged_df['_merge'] == 'left_only']
+    unmatched_df = unmatched_df[KEYS].drop_duplicates()
+    write_output(unmatched_df, 'element_components_missing', file_format)
+
+    merged_df = merged_df.drop(columns=['_merge'])
+    write_output(merged_df, 'totem_data', file_format)
+
+def read_chunks(path, chunk_size):
+    # Raw strings, missing values already NaN; the column types are settled over the whole file first
+    return pd.read_csv(path, sep=SEP, dtype=object, chunksize=chunk_size)
+
+def value_kind(values):
+    values = values.dropna()
+    if values.empty:
+        return None
+    if values.isin(list(BOOLEANS)).all():
+        return 'bool'
+    if values.str.fullmatch(INTEGER).all():
+        return 'int'
+    if values.str.fullmatch(FLOAT).all():
+        return 'float'
+    return 'object'
+
+def combine_kinds(first, second):
+    if first is None or first == second:
+        return second
+    if second is None:
+        return first
+    if {first, second} == {'int', 'float'}:
+        return 'float'
+    return 'object'
+
+def column_type(kind, has_missing):
+    # A column without values is all NaN, integers with gaps become floats and booleans with gaps stay objects
+    if kind is None:
+        return 'float'
+    if kind == 'int' and has_missing:
+        return 'float'
+    if kind == 'bool' and has_missing:
+        return 'bool_object'
+    return kind
+
+def convert_chunk(chunk, types):
+    for column, column_type in types.items():
+        if column_type == 'int':
+            chunk[column] = chunk[column].astype('int64')
+        elif column_type == 'float':
+            chunk[column] = chunk[column].astype('float64')
+        elif column_type == 'bool':
+            chunk[column] = chunk[column].map(BOOLEANS).astype(bool)
+        elif column_type == 'bool_object':
+            chunk[column] = chunk[column].map(lambda value: BOOLEANS.get(value, value))
+    return chunk
+
+def index_key(values):
+    # NaN keys match each other, like they do in pd.merge
+    return tuple(None if pd.isna(value) else value for value in values)
+
+def component_index(components):
+    index = {}
+    for position, key in enumerate(zip(*(components[key] for key in KEYS))):
+        index.setdefault(index_key(key), []).append(position)
+    return index
+
+def element_types(elements_path, chunk_size, index, on_chunk=None):
+    kinds = {}
+    has_missing = {}
+    has_unmatched = False
+    for chunk in read_chunks(elements_path, chunk_size):
+        if on_chunk is not None:
+            on_chunk(chunk)
+        for column in chunk.columns:
+            kinds[column] = combine_kinds(kinds.get(column), value_kind(chunk[column]))
+            has_missing[column] = has_missing.get(column, False) or bool(chunk[column].isna().any())
+        has_unmatched = has_unmatched or any(index_key(key) not in index for key in zip(*(chunk[key] for key in KEYS)))
+    return {column: column_type(kinds[column], has_missing[column]) for column in kinds}, has_unmatched
+
+def merged_columns(element_columns, component_columns):
+    component_columns = [column for column in component_columns if column not in KEYS]
+    overlap = set(element_columns) & set(component_columns)
+    return ([f"{column}_x" if column in overlap else column for column in element_columns]
+            + [f"{column}_y" if column in overlap else column for column in component_columns])
+
+def join_chunk(chunk, components, index, missing_position):
+    element_rows = []
+    component_rows = []
+    unmatched = []
+    for row, key in enumerate(zip(*(chunk[key] for key in KEYS))):
+        positions = index.get(index_key(key))
+        if positions:
+            element_rows.extend([row] * len(positions))
+            component_rows.extend(positions)
+        else:
+            element_rows.append(row)
+            component_rows.append(missing_position)
+            unmatched.append(row)
+
+    left = chunk.take(element_rows).reset_index(drop=True)
+    right = components.take(component_rows).drop(columns=KEYS).reset_index(drop=True)
+    overlap = set(left.columns) & set(right.columns)
+    left = left.rename(columns={column: f"{column}_x" for column in overlap})
+    right = right.rename(columns={column: f"{column}_y" for column in overlap})
+    return pd.concat([left, right], axis=1), chunk.take(unmatched)[KEYS].drop_duplicates()
+
+def merge_streaming(elements_path, components_path, chunk_size=CHUNK_SIZE):
+    # Same output as merge(), holding the components and one chunk of elements in memory. The elements are read
+    # twice: once to settle their column types as pandas would for the whole file, once to join and write them.
+    df2 = pd.read_csv(components_path, sep=SEP, engine='python')
+    write_densities(df2)
+    index = component_index(df2)
+
+    types, has_unmatched = element_types(elements_path, chunk_size, index)
+    # Rows without a component get NaN component values, which turns the component columns into the types a left
+    # merge gives them when any element is unmatched, in every chunk alike
+    missing_position = len(df2)
+    components = df2.reindex(range(len(df2) + 1)) if has_unmatched else df2
+
+    missing_parts = []
+    with open('totem_data.csv', mode='w', newline='', encoding='utf-8') as file:
+        header = True
+        for chunk in read_chunks(elements_path, chunk_size):
+            merged, unmatched = join_chunk(convert_chunk(chunk, types), components, index, missing_position)
+            merged.to_csv(file, index=False, sep=SEP, header=header)
+            missing_parts.append(unmatched)
+            header = False
+        if header:
+            columns = list(pd.read_csv(elements_path, sep=SEP, nrows=0).columns)
+            pd.DataFrame(columns=columns + [column for column in df2.columns if column not in KEYS]).to_csv(file, index=False, sep=SEP)
+
+    if missing_parts:
+        unmatched_df = pd.concat(missing_parts).drop_duplicates()
+    else:
+        unmatched_df = pd.DataFrame(columns=KEYS)
+    unmatched_df.to_csv('element_components_missing.csv', index=False, sep=SEP)
+
+def raw_values(row):
+    return [None if pd.isna(value) else value for value in row]
+
+def component_hashes(components_path):
+    # One hash per (Component Name, Application) group over the raw values of its rows
+    raw = pd.read_csv(components_path, sep=SEP, dtype=object)
+    hashers = {}
+    for key, row in zip(zip(*(raw[key] for key in KEYS)), raw.itertuples(index=False, name=None)):
+        hashers.setdefault(json.dumps(index_key(key)), hashlib.sha1()).update(json.dumps(raw_values(row)).encode('utf-8'))
+    return {key: hasher.hexdigest() for key, hasher in hashers.items()}
+
+def file_hash(path):
+    hasher = hashlib.sha1()
+    with open(path, mode='rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def load_state(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def save_state(path, state):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, mode='w') as file:
+        json.dump(state, file)
+    os.replace(temporary_path, path)
+
+# Numbers the blocks of consecutive rows of the same element across chunks, a block can span two chunks
+class BlockCounter:
+    def __init__(self):
+        self.count = 0
+        self.last_name = object()
+
+    def block_ids(self, chunk):
+        ids = []
+        for name in chunk['Element Name']:
+            name = None if pd.isna(name) else name
+            if name != self.last_name:
+                self.count += 1
+                self.last_name = name
+            ids.append(self.count - 1)
+        return ids
+
+# Hashes the raw rows of each element block and collects the component keys it refers to, while the first pass over
+# the elements settles their column types
+class ElementBlocks:
+    def __init__(self):
+        self.counter = BlockCounter()
+        self.blocks = []
+        self.hashers = []
+
+    def add_chunk(self, chunk):
+        ids = self.counter.block_ids(chunk)
+        for block_id, name, key, row in zip(ids, chunk['Element Name'], zip(*(chunk[key] for key in KEYS)), chunk.itertuples(index=False, name=None)):
+            if block_id == len(self.blocks):
+                self.blocks.append({'name': None if pd.isna(name) else name, 'keys': []})
+                self.hashers.append(hashlib.sha1())
+            key = json.dumps(index_key(key))
+            if key not in self.blocks[block_id]['keys']:
+                self.blocks[block_id]['keys'].append(key)
+            self.hashers[block_id].update(json.dumps(raw_values(row)).encode('utf-8'))
+
+    def finish(self):
+        for block, hasher in zip(self.blocks, self.hashers):
+            block['hash'] = hasher.hexdigest()
+        return self.blocks
+
+def split_records(text):
+    # Records of a to_csv output; a line break inside a quoted value leaves an odd number of quotes before it
+    records = []
+    pending = ''
+    for piece in text.split(os.linesep)[:-1]:
+        pending += piece
+        if pending.count('"') % 2 == 0:
+            records.append(pending + os.linesep)
+            pending = ''
+        else:
+            pending += os.linesep
+    return records
+
+def reusable_blocks(blocks, state, signature, hashes, output_path):
+    # Blocks whose rows and components are unchanged since the last merge, with the position and byte range of their
+    # rows in the previous output. Elements are matched by name and occurrence, so inserted elements shift nothing.
+    if state is None or state['signature'] != signature or not os.path.isfile(output_path) or os.path.getsize(output_path) != state['size']:
+        return {}
+    previous = {}
+    start = state['header_size']
+    for position, (name, block_hash, keys, end) in enumerate(state['blocks']):
+        previous.setdefault(name, []).append((position, block_hash, keys, start, end))
+        start = end
+
+    reusable = {}
+    occurrences = {}
+    for block_id, block in enumerate(blocks):
+        occurrence = occurrences.get(block['name'], 0)
+        occurrences[block['name']] = occurrence + 1
+        candidates = previous.get(block['name'], [])
+        if occurrence >= len(candidates):
+            continue
+        position, block_hash, keys, start, end = candidates[occurrence]
+        if block_hash == block['hash'] and all(hashes.get(key) == state['components'].get(key) for key in keys):
+            reusable[block_id] = (position, start, end)
+    return reusable
+
+def unmatched_keys(chunk, keys, index):
+    return chunk[[key not in index for key in keys]][KEYS].drop_duplicates()
+
+def write_if_changed(path, content):
+    if os.path.isfile(path) and file_hash(path) == hashlib.sha1(content).hexdigest():
+        return False
+    with open(path, mode='wb') as file:
+        file.write(content)
+    return True
+
+def merge_incremental(elements_path, components_path, chunk_size=CHUNK_SIZE, state_path=STATE_PATH):
+    # Same output as merge(). Only elements whose own rows or whose components changed since the last incremental
+    # merge are joined again, the rows of the others are copied from the previous totem_data.csv
+    output_path = 'totem_data.csv'
+    state = load_state(state_path)
+
+    df2 = pd.read_csv(components_path, sep=SEP, engine='python')
+    components_file = file_hash(components_path)
+    if state is None or state['components_file'] != components_file or not os.path.isfile('components_with_densities.csv'):
+        write_densities(df2)
+    index = component_index(df2)
+    hashes = component_hashes(components_path)
+
+    element_blocks = ElementBlocks()
+    types, has_unmatched = element_types(elements_path, chunk_size, index, element_blocks.add_chunk)
+    blocks = element_blocks.finish()
+    columns = merged_columns(list(pd.read_csv(elements_path, sep=SEP, nrows=0).columns), list(df2.columns))
+    # Anything that changes how values are formatted invalidates all previous rows
+    signature = {
+        'types': types,
+        'components': {column: str(dtype) for column, dtype in df2.dtypes.items()},
+        'has_unmatched': has_unmatched,
+        'columns': columns
+    }
+
+    reusable = reusable_blocks(blocks, state, signature, hashes, output_path)
+    unchanged = len(reusable) == len(blocks) == len(state['blocks']) if state else False
+    unchanged = unchanged and all(position == block_id for block_id, (position, _, _) in reusable.items())
+    missing_position = len(df2)
+    components = df2.reindex(range(len(df2) + 1)) if has_unmatched else df2
+
+    missing_parts = []
+    counter = BlockCounter()
+    if unchanged:
+        # Nothing to join, only the list of missing components is checked
+        for chunk in read_chunks(elements_path, chunk_size):
+            chunk = convert_chunk(chunk, types)
+            missing_parts.append(unmatched_keys(chunk, [index_key(key) for key in zip(*(chunk[key] for key in KEYS))], index))
+        header_size = state['header_size']
+        ends = [end for _, _, _, end in state['blocks']]
+    else:
+        ends = [None] * len(blocks)
+        temporary_path = f"{output_path}.tmp"
+        with open(temporary_path, mode='wb') as output, open(output_path if reusable else os.devnull, mode='rb') as previous:
+            output.write(pd.DataFrame(columns=columns).to_csv(index=False, sep=SEP).encode('utf-8'))
+            header_size = output.tell()
 
-df1 = pd.read_csv('elements.csv', sep=SEP, engine='python')
-df2 = pd.read_csv('components.csv', sep=SEP, engine='python')
+            def join_rows(chunk, rows):
+                # Joins the changed rows collected so far and notes where the rows of each of their blocks end
+                if not rows:
+                    return
+                merged, _ = join_chunk(chunk.iloc[[row for row, _, _ in rows]], components, index, missing_position)
+                records = split_records(merged.to_csv(index=False, sep=SEP, header=False))
+                position = 0
+                for _, block_id, count in rows:
+                    output.write(''.join(records[position:position + count]).encode('utf-8'))
+                    ends[block_id] = output.tell()
+                    position += count
+                rows.clear()
 
-densities = df2[df2['Min Density'].notnull()]
-densities.to_csv('components_with_densities.csv', index=False, sep=SEP)
+            for chunk in read_chunks(elements_path, chunk_size):
+                ids = counter.block_ids(chunk)
+                chunk = convert_chunk(chunk, types)
+                keys = [index_key(key) for key in zip(*(chunk[key] for key in KEYS))]
+                missing_parts.append(unmatched_keys(chunk, keys, index))
+                pending = []
+                for row, (block_id, key) in enumerate(zip(ids, keys)):
+                    if block_id not in reusable:
+                        pending.append((row, block_id, max(len(index.get(key, [])), 1)))
+                    elif ends[block_id] is None:
+                        join_rows(chunk, pending)
+                        _, start, end = reusable[block_id]
+                        previous.seek(start)
+                        output.write(previous.read(end - start))
+                        ends[block_id] = output.tell()
+                join_rows(chunk, pending)
+        os.replace(temporary_path, output_path)
 
-# duplicated_elements = df1.groupby(['Element Name', 'Layer', 'Component Name', 'Application']).size().reset_index(name='match_count')
-# duplicated_elements = duplicated_elements[duplicated_elements['match_count'] > 1]
-# if not duplicated_elements.empty:
-#     raise ValueError(f"Found duplicated elements: {duplicated_elements}")
+    unmatched_df = pd.concat(missing_parts).drop_duplicates() if missing_parts else pd.DataFrame(columns=KEYS)
+    write_if_changed('element_components_missing.csv', unmatched_df.to_csv(index=False, sep=SEP).encode('utf-8'))
 
-# duplicated_components = df2.groupby(['Component Name', 'Application', 'LCI-ID', 'Material']).size().reset_index(name='match_count')
-# duplicated_components = duplicated_components[duplicated_components['match_count'] > 1]
-# if not duplicated_components.empty:
-#     raise ValueError(f"Found duplicated components: {duplicated_components}")
+    save_state(state_path, {
+        'signature': signature,
+        'components_file': components_file,
+        'components': hashes,
+        'header_size': header_size,
+        'size': os.path.getsize(output_path),
+        'blocks': [[block['name'], block['hash'], block['keys'], end] for block, end in zip(blocks, ends)]
+    })
+    logging.info(f"Merged {len(blocks) - len(reusable)} of {len(blocks)} elements again, {len(reusable)} unchanged")
 
-merged_df = pd.merge(df1, df2, on=['Component Name', 'Application'], how='left', indicator=True)
+def main():
+    parser = argparse.ArgumentParser(description="Join the scraped elements with their components into totem_data.csv")
+    parser.add_argument('--elements', help="default elements.csv, or elements.parquet with --format parquet")
+    parser.add_argument('--components', help="default components.csv, or components.parquet with --format parquet")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="format of the inputs and outputs, parquet as written by `scrape.py --parquet`")
+    parser.add_argument('--streaming', action='store_true', help="join the elements chunk by chunk, memory use does not grow with their number")
+    parser.add_argument('--incremental', action='store_true', help=f"only join elements whose rows or components changed since the last incremental merge, tracked in {STATE_PATH}")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="element rows per chunk with --streaming and --incremental")
+    parser.add_argument('--sqlite', help="also write the elements and components to this SQLite database, with totem_data as a view")
+    args = parser.parse_args()
+    if args.format == 'parquet' and (args.streaming or args.incremental or args.sqlite):
+        parser.error("--streaming, --incremental and --sqlite work on the CSV files")
+    args.elements = args.elements or f"elements.{args.format}"
+    args.components = args.components or f"components.{args.format}"
 
-unmatched_df = merged_df[merged_df['_merge'] == 'left_only']
-unmatched_df = unmatched_df[['Component Name', 'Application']].drop_duplicates()
-unmatched_df.to_csv('element_components_missing.csv', index=False, sep=SEP)
+    if args.incremental:
+        merge_incremental(args.elements, args.components, args.chunk_size)
+    elif args.streaming:
+        merge_streaming(args.elements, args.components, args.chunk_size)
+    else:
+        merge(args.elements, args.components, args.format)
+    if args.sqlite:
+        store.build(args.sqlite, args.elements, args.components)
 
-merged_df = merged_df.drop(columns=['_merge'])
-merged_df.to_csv('totem_data.csv', index=False, sep=SEP)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
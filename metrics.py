@@ -0,0 +1,149 @@
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+PHASES = ('click', 'wait', 'extract', 'write')
+PERCENTILES = (50, 90, 99)
+SLOWEST_ITEMS = 10
+
+# The item a worker thread is currently scraping, so helpers deep in the call stack can account to it
+local = threading.local()
+
+def current_item():
+    return getattr(local, 'item', None)
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        item = current_item()
+        if item is not None:
+            item['phases'][name] += time.perf_counter() - start
+
+def count(field, amount=1):
+    item = current_item()
+    if item is not None:
+        item[field] += amount
+
+def set_branch(branch):
+    item = current_item()
+    if item is not None:
+        item['branch'] = branch
+
+def set_error(error):
+    item = current_item()
+    if item is not None:
+        item['error'] = f"{type(error).__name__}: {error}"
+
+def count_commands(execute):
+    # Wraps WebDriver.execute, the single funnel for the commands of the driver and its elements
+    def counted_execute(driver_command, params=None):
+        count('commands')
+        return execute(driver_command, params)
+    return counted_execute
+
+def percentile(values, p):
+    # Nearest rank on sorted values
+    if not values:
+        return None
+    rank = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+# Collects one metrics line per scraped item of a library run into <output>.metrics.jsonl
+class Recorder:
+    def __init__(self, kind, output_path, items):
+        self.kind = kind
+        self.path = f"{output_path}.metrics.jsonl"
+        self.summary_path = f"{output_path}.metrics-summary.json"
+        self.labels = [item['label'] for item in items]
+        self.items = {}
+        self.finished = []
+        self.file = open(self.path, mode='w')
+
+    def start(self, index):
+        # Another attempt at an item keeps adding to the line of the first one
+        item = self.items.get(index)
+        if item is None:
+            item = {
+                'kind': self.kind,
+                'index': index,
+                'label': self.labels[index],
+                'started': time.time(),
+                'phases': dict.fromkeys(PHASES, 0.0),
+                'commands': 0,
+                'retries': 0,
+                'pane_timeouts': 0,
+                'branch': None,
+                'error': None,
+                'capture_seconds': 0.0
+            }
+            self.items[index] = item
+        else:
+            item['retries'] += 1
+        item['capture_start'] = time.perf_counter()
+        local.item = item
+
+    def captured(self, index):
+        item = self.items.get(index)
+        if item is not None:
+            item['capture_seconds'] += time.perf_counter() - item.pop('capture_start')
+        local.item = None
+
+    def finish(self, index, status, rows=0, write_seconds=0.0):
+        # Called by the writer thread, items carried over from a previous run were never started
+        item = self.items.pop(index, None)
+        if item is None:
+            return
+        item.pop('capture_start', None)
+        item['phases']['write'] += write_seconds
+        item['seconds'] = item['capture_seconds'] + write_seconds
+        item['status'] = status
+        item['rows'] = rows
+        self.file.write(json.dumps(item) + '\n')
+        self.finished.append(item)
+
+    def summary(self):
+        self.file.close()
+        if not self.finished:
+            return None
+
+        def distribution(values):
+            values = sorted(values)
+            result = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+            result['max'] = values[-1]
+            result['total'] = sum(values)
+            return result
+
+        summary = {
+            'kind': self.kind,
+            'items': len(self.finished),
+            'failed': sum(1 for item in self.finished if item['status'] != 'ok'),
+            'seconds': distribution([item['seconds'] for item in self.finished]),
+            'phases': {name: distribution([item['phases'][name] for item in self.finished]) for name in PHASES},
+            'commands': distribution([item['commands'] for item in self.finished]),
+            'retries': sum(item['retries'] for item in self.finished),
+            'pane_timeouts': sum(item['pane_timeouts'] for item in self.finished),
+            'branches': {},
+            'slowest': [
+                {'index': item['index'], 'label': item['label'], 'seconds': item['seconds'], 'branch': item['branch']}
+                for item in sorted(self.finished, key=lambda item: item['seconds'], reverse=True)[:SLOWEST_ITEMS]
+            ]
+        }
+        for item in self.finished:
+            summary['branches'][item['branch']] = summary['branches'].get(item['branch'], 0) + 1
+        with open(self.summary_path, mode='w') as file:
+            json.dump(summary, file, indent=2)
+
+        seconds = summary['seconds']
+        logging.info(f"{self.kind}: {summary['items']} items, {summary['failed']} failed, "
+                     f"p50 {seconds['p50']:.2f}s, p90 {seconds['p90']:.2f}s, p99 {seconds['p99']:.2f}s, max {seconds['max']:.2f}s per item")
+        logging.info(f"{self.kind}: time per phase " + ", ".join(f"{name} {summary['phases'][name]['total']:.1f}s" for name in PHASES)
+                     + f", p50 {summary['commands']['p50']} commands per item")
+        for item in summary['slowest']:
+            logging.info(f"{self.kind}: slow item {item['index'] + 1} '{item['label']}' ({item['branch']}): {item['seconds']:.2f}s")
+        return summary
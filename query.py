@@ -0,0 +1,315 @@
+import os
+import csv
+import sys
+import json
+import math
+import mmap
+import bisect
+import struct
+import logging
+import argparse
+from array import array
+
+from store import NUMBER_COLUMNS, number
+
+SEP = ';'
+CACHE_PATH = '.totem_query.cache'
+MAGIC = b'TOTEMQ01'
+# Code of a missing string value
+MISSING = 0xFFFFFFFF
+
+# Lookup name, table and key columns of the indexes kept in the cache
+INDEXES = {
+    'element': ('elements', ['Element Name']),
+    'component': ('components', ['Component Name', 'Application']),
+    'lci_id': ('components', ['LCI-ID']),
+    'material': ('components', ['Material'])
+}
+
+def attribute(column):
+    # 'Element U-Value' -> element_u_value, 'LCI-ID' -> lci_id
+    return column.lower().replace(' ', '_').replace('-', '_')
+
+# One row of elements.csv or components.csv, values by attribute name; missing values are None
+class Record:
+    __slots__ = ()
+    columns = []
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    def values(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+def record_type(name, columns):
+    return type(name, (Record,), {'__slots__': tuple(attribute(column) for column in columns), 'columns': columns})
+
+RECORD_NAMES = {
+    'elements': 'ElementRow',
+    'components': 'ComponentRow'
+}
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file, delimiter=SEP)
+        columns = next(reader, [])
+        return columns, list(reader)
+
+def source_state(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+def index_key(codes):
+    # One or two string codes packed into one sortable integer
+    key = 0
+    for code in codes:
+        key = (key << 32) | code
+    return key
+
+def build_cache(sources, cache_path):
+    # Layout: MAGIC, the length of the JSON header, the header, then the arrays it points to, each 8-byte aligned.
+    # Strings are stored once, sorted, and referred to by their position; numbers as float64 with NaN for missing.
+    tables = {kind: read_csv(path) for kind, path in sources.items()}
+    strings = sorted({value for kind, (columns, rows) in tables.items() for row in rows
+                      for column, value in zip(columns, row) if column not in NUMBER_COLUMNS and value != ''})
+    codes = {value: code for code, value in enumerate(strings)}
+
+    sections = []
+    header = {'sources': {kind: source_state(path) for kind, path in sources.items()}, 'tables': {}, 'indexes': {}}
+
+    blob = bytearray()
+    offsets = array('I', [0])
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    header['strings'] = {'count': len(strings), 'offsets': len(sections), 'blob': len(sections) + 1}
+    sections += [offsets, bytes(blob)]
+
+    for kind, (columns, rows) in tables.items():
+        table = {'rows': len(rows), 'columns': []}
+        for position, column in enumerate(columns):
+            values = [row[position] if position < len(row) else '' for row in rows]
+            if column in NUMBER_COLUMNS:
+                data = array('d', [math.nan if value is None else value for value in map(number, values)])
+            else:
+                data = array('I', [codes[value] if value != '' else MISSING for value in values])
+            table['columns'].append({'name': column, 'type': data.typecode, 'section': len(sections)})
+            sections.append(data)
+        header['tables'][kind] = table
+
+    for name, (kind, key_columns) in INDEXES.items():
+        columns, rows = tables[kind]
+        positions = [columns.index(column) for column in key_columns]
+        entries = sorted((index_key(codes[row[p]] for p in positions), i) for i, row in enumerate(rows)
+                         if all(p < len(row) and row[p] != '' for p in positions))
+        keys = array('Q')
+        starts = array('I')
+        for start, (key, _) in enumerate(entries):
+            if not keys or keys[-1] != key:
+                keys.append(key)
+                starts.append(start)
+        starts.append(len(entries))
+        header['indexes'][name] = {'table': kind, 'columns': key_columns, 'keys': len(sections), 'starts': len(sections) + 1, 'rows': len(sections) + 2}
+        sections += [keys, starts, array('I', [i for _, i in entries])]
+
+    # Offsets are relative to the start of the data, the first 8-byte boundary after the header
+    position = 0
+    header['sections'] = []
+    for section in sections:
+        header['sections'].append([position, len(bytes(section))])
+        position = align(position + len(bytes(section)))
+    encoded = json.dumps(header).encode('utf-8')
+
+    temporary_path = f"{cache_path}.tmp"
+    with open(temporary_path, mode='wb') as file:
+        file.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        data_start = align(file.tell())
+        for (offset, _), section in zip(header['sections'], sections):
+            file.write(b'\0' * (data_start + offset - file.tell()))
+            file.write(bytes(section))
+    os.replace(temporary_path, cache_path)
+
+def align(position):
+    return (position + 7) & ~7
+
+def read_header(path):
+    try:
+        with open(path, mode='rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                return None
+            length, = struct.unpack('<I', file.read(4))
+            return json.loads(file.read(length))
+    except (OSError, ValueError, struct.error):
+        return None
+
+def is_current(header, sources):
+    return header is not None and header['sources'] == {kind: source_state(path) for kind, path in sources.items()}
+
+# The sorted string pool as a read-only sequence, so bisect can search it without decoding all of it. Strings are
+# decoded once, on first use.
+class Strings:
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        self.decoded = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        value = self.decoded.get(code)
+        if value is None:
+            value = self.decoded[code] = str(self.blob[self.offsets[code]:self.offsets[code + 1]], 'utf-8')
+        return value
+
+    def code(self, value):
+        code = bisect.bisect_left(self, value)
+        return code if code < len(self) and self[code] == value else None
+
+class Table:
+    def __init__(self, kind, columns, strings):
+        self.kind = kind
+        self.strings = strings
+        self.columns = [column for column, _ in columns]
+        self.data = [data for _, data in columns]
+        self.record_type = record_type(RECORD_NAMES[kind], self.columns)
+        self.rows = len(self.data[0]) if self.data else 0
+
+    def __len__(self):
+        return self.rows
+
+    def record(self, i):
+        values = []
+        for data in self.data:
+            value = data[i]
+            if data.format == 'd':
+                # NaN marks a missing number
+                values.append(None if value != value else value)
+            else:
+                values.append(None if value == MISSING else self.strings[value])
+        return self.record_type(*values)
+
+    def __iter__(self):
+        return (self.record(i) for i in range(self.rows))
+
+class Index:
+    def __init__(self, table, columns, keys, starts, rows):
+        self.table = table
+        self.columns = columns
+        self.keys = keys
+        self.starts = starts
+        self.rows = rows
+
+    def find(self, *values):
+        # Rows with the given key, or with a given first part of it when fewer values than key columns are passed
+        codes = [self.table.strings.code(value) for value in values]
+        if None in codes:
+            return []
+        width = 32 * (len(self.columns) - len(codes))
+        low = index_key(codes) << width
+        first = bisect.bisect_left(self.keys, low)
+        last = bisect.bisect_left(self.keys, low + (1 << width))
+        return [self.table.record(i) for i in self.rows[self.starts[first]:self.starts[last]]]
+
+# The scraped libraries mapped from the cache. Loading reads no CSV once the cache is current, records are only built
+# for the rows a query returns.
+class Dataset:
+    def __init__(self, path):
+        with open(path, mode='rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        length, = struct.unpack_from('<I', view, len(MAGIC))
+        header = json.loads(bytes(view[len(MAGIC) + 4:len(MAGIC) + 4 + length]))
+        data_start = align(len(MAGIC) + 4 + length)
+
+        def section(number, typecode=None):
+            offset, size = header['sections'][number]
+            data = view[data_start + offset:data_start + offset + size]
+            return data.cast(typecode) if typecode else data
+
+        self.strings = Strings(section(header['strings']['offsets'], 'I'), section(header['strings']['blob']))
+        self.tables = {
+            kind: Table(kind, [(column['name'], section(column['section'], column['type'])) for column in table['columns']], self.strings)
+            for kind, table in header['tables'].items()
+        }
+        self.indexes = {
+            name: Index(self.tables[index['table']], index['columns'], section(index['keys'], 'Q'), section(index['starts'], 'I'), section(index['rows'], 'I'))
+            for name, index in header['indexes'].items()
+        }
+
+    @property
+    def elements(self):
+        return self.tables['elements']
+
+    @property
+    def components(self):
+        return self.tables['components']
+
+    def element(self, name):
+        # The layers of an element, as rows of elements.csv
+        return self.indexes['element'].find(name)
+
+    def component(self, name, application=None):
+        # The materials of a component, of one application or of all of them
+        return self.indexes['component'].find(name) if application is None else self.indexes['component'].find(name, application)
+
+    def lci_id(self, lci_id):
+        return self.indexes['lci_id'].find(lci_id)
+
+    def material(self, material):
+        return self.indexes['material'].find(material)
+
+    def element_components(self, name):
+        # The rows merge.py joins for an element: every layer with the component rows of its (Component Name, Application)
+        return [(layer, self.component(layer.component_name, layer.application) if layer.component_name and layer.application else [])
+                for layer in self.element(name)]
+
+def load(elements_path='elements.csv', components_path='components.csv', cache_path=CACHE_PATH, rebuild=False):
+    sources = {'elements': elements_path, 'components': components_path}
+    if rebuild or not is_current(read_header(cache_path), sources):
+        logging.info(f"Building {cache_path} from {elements_path} and {components_path}")
+        build_cache(sources, cache_path)
+    return Dataset(cache_path)
+
+def main():
+    # Only when run as a script, an importing script keeps its own logging setup
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Look up scraped elements and components through an indexed binary cache of elements.csv and components.csv")
+    parser.add_argument('--elements', default='elements.csv')
+    parser.add_argument('--components', default='components.csv')
+    parser.add_argument('--cache', default=CACHE_PATH)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the cache even if the CSV files did not change")
+    lookup = parser.add_mutually_exclusive_group()
+    lookup.add_argument('--element', help="layers of the element with this name, with the rows of their components")
+    lookup.add_argument('--component', help="rows of the component with this name, see --application")
+    lookup.add_argument('--lci-id', help="component rows with this LCI-ID")
+    lookup.add_argument('--material', help="component rows with this end-of-life material")
+    parser.add_argument('--application', help="only the rows of this application of --component")
+    args = parser.parse_args()
+
+    dataset = load(args.elements, args.components, args.cache, args.rebuild)
+    writer = csv.writer(sys.stdout, delimiter=SEP)
+    if args.element:
+        writer.writerow(dataset.elements.columns + dataset.components.columns[2:])
+        for layer, components in dataset.element_components(args.element):
+            for component in components or [None]:
+                writer.writerow(layer.values() + (component.values()[2:] if component else []))
+    elif args.component or args.lci_id or args.material:
+        if args.component:
+            records = dataset.component(args.component, args.application)
+        elif args.lci_id:
+            records = dataset.lci_id(args.lci_id)
+        else:
+            records = dataset.material(args.material)
+        writer.writerow(dataset.components.columns)
+        for record in records:
+            writer.writerow(record.values())
+    else:
+        logging.info(f"{len(dataset.elements)} element rows and {len(dataset.components)} component rows in {args.cache}")
+
+if __name__ == '__main__':
+    main()
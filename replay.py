@@ -0,0 +1,323 @@
+import os
+import json
+import logging
+import uuid
+import argparse
+import threading
+import traceback
+from http.cookies import SimpleCookie
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import lxml.html
+import lxml.etree
+from selenium.webdriver.common.by import By
+
+import scrape
+from scrape import LIBRARIES, COMPONENT_LIVE_SELECTORS, selection_details_selector, application_unit_selector, parse_element_details
+from totem_http import file_name_for
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LIBRARY_KINDS = {
+    'ELEMENTTYPE': 'elements',
+    'COMPONENT': 'components'
+}
+DOM_ROUTE = '/_replay/'
+# Set with every library page, so parallel workers each get the fixtures of their own selection
+CLIENT_COOKIE = 'replay_client'
+
+# Detail pane layouts a recording should contain at least once, so every parsing and clicking branch gets replayed
+REQUIRED_CASES = {
+    'elements': {'homogeneous', 'heterogeneous'},
+    'components': {'epdDetails', 'multi_tab', 'worksectionDetails', 'groupDetails'}
+}
+# Tab bars of the component panes, a click on a tab loads the pane recorded for its position
+COMPONENT_TABS = {
+    'epdDetails': f"{application_unit_selector} div.tab",
+    'groupDetails': f"{selection_details_selector} > div.groupDetails div.variantSelector > div.tab"
+}
+
+# Takes the place of the site's own scripts in a recorded page. Clicks on a list item or a tab fetch the pane recorded
+# for it and patch it into the page node by node, like the live app does, so element handles held by the scraper
+# (e.g. the tabs of a pane) stay valid and the pane observer sees the same kind of mutations.
+REPLAY_SCRIPT = """
+(() => {
+    const config = %s;
+    let selected = null;
+    const morph = (current, next) => {
+        if (current.nodeType !== next.nodeType || current.nodeName !== next.nodeName) {
+            current.replaceWith(next);
+            return;
+        }
+        if (current.nodeType !== Node.ELEMENT_NODE) {
+            if (current.nodeValue !== next.nodeValue) {
+                current.nodeValue = next.nodeValue;
+            }
+            return;
+        }
+        for (const attribute of Array.from(current.attributes)) {
+            if (!next.hasAttribute(attribute.name)) {
+                current.removeAttribute(attribute.name);
+            }
+        }
+        for (const attribute of Array.from(next.attributes)) {
+            if (current.getAttribute(attribute.name) !== attribute.value) {
+                current.setAttribute(attribute.name, attribute.value);
+            }
+        }
+        const currentChildren = Array.from(current.childNodes);
+        const nextChildren = Array.from(next.childNodes);
+        nextChildren.forEach((child, k) => k < currentChildren.length ? morph(currentChildren[k], child) : current.appendChild(child));
+        currentChildren.slice(nextChildren.length).forEach(child => child.remove());
+    };
+    const load = path => fetch(config.route + path).then(response => response.ok ? response.text() : null).then(markup => {
+        const pane = document.querySelector(config.pane);
+        if (markup === null || pane === null) {
+            return;
+        }
+        const template = document.createElement('template');
+        template.innerHTML = markup.trim();
+        morph(pane, template.content.firstElementChild);
+    });
+    // Moves the recorded selection marker to the clicked entry, as the live app does
+    const isMarker = name => /^(ui-state-)?(selected|active|current)$/i.test(name);
+    const select = (entries, chosen) => {
+        for (const entry of entries) {
+            const markers = Array.from(entry.classList).filter(isMarker);
+            if (entry !== chosen && markers.length) {
+                entry.classList.remove(...markers);
+                chosen.classList.add(...markers);
+            }
+            if (entry !== chosen && entry.getAttribute('aria-selected') === 'true') {
+                entry.setAttribute('aria-selected', 'false');
+                chosen.setAttribute('aria-selected', 'true');
+            }
+        }
+    };
+    document.addEventListener('click', event => {
+        const list = document.querySelector(config.list);
+        const item = list && Array.from(list.children).find(child => child.contains(event.target));
+        if (item) {
+            selected = Array.prototype.indexOf.call(list.children, item);
+            select(list.children, item);
+            load(`${selected}`);
+            return;
+        }
+        const tab = event.target.closest('div.tab');
+        const tabBar = tab && tab.closest('.applicationUnitSelector, .variantSelector');
+        if (tabBar && selected !== null) {
+            const tabs = Array.from(tabBar.querySelectorAll('div.tab'));
+            select(tabs, tab);
+            load(`${selected}/${tabs.indexOf(tab)}`);
+        }
+    });
+})();
+"""
+
+# Stand-in for the TOTEM server, answering with the fixtures recorded by `totem_http.py --record` (partial responses
+# of the HTTP engine) or by `replay.py --record` (rendered pages and detail panes for the browser scraper)
+class ReplayHandler(BaseHTTPRequestHandler):
+    fixtures = 'fixtures'
+    # Library and selected item per client, like the view state the live server keeps per session
+    clients = {}
+    clients_lock = threading.Lock()
+
+    def client(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        client = cookie[CLIENT_COOKIE].value if CLIENT_COOKIE in cookie else None
+        with self.clients_lock:
+            return self.clients.get(client, {'library': None, 'selected_item': None})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith(DOM_ROUTE):
+            kind, _, pane = url.path[len(DOM_ROUTE):].partition('/')
+            pane_path = os.path.normpath(os.path.join('panes', f"{pane}.html"))
+            if kind not in LIBRARIES or pane_path.startswith('..'):
+                self.send_error(404)
+                return
+            self.send_fixture(os.path.join(self.fixtures, kind, pane_path), 'text/html; charset=utf-8')
+            return
+        kind = LIBRARY_KINDS.get(parse_qs(url.query).get('l', [None])[0])
+        if kind is None:
+            self.send_fixture(os.path.join(self.fixtures, 'home.html'), 'text/html; charset=utf-8')
+            return
+        client = uuid.uuid4().hex
+        with self.clients_lock:
+            self.clients[client] = {'library': kind, 'selected_item': None}
+        self.send_fixture(os.path.join(self.fixtures, kind, 'page.html'), 'text/html; charset=utf-8',
+                          {'Set-Cookie': f"{CLIENT_COOKIE}={client}; Path=/"})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        source = file_name_for(form.get('javax.faces.source', [''])[0])
+
+        client = self.client()
+        item_path = os.path.join(self.fixtures, client['library'] or '', f"{source}.xml")
+        if os.path.isfile(item_path):
+            client['selected_item'] = source
+            self.send_fixture(item_path, 'text/xml; charset=utf-8')
+        else:
+            self.send_fixture(os.path.join(self.fixtures, client['library'] or '', client['selected_item'] or 'page', f"{source}.xml"), 'text/xml; charset=utf-8')
+
+    def send_fixture(self, path, content_type, headers=None):
+        if not os.path.isfile(path):
+            logging.warning(f"No fixture recorded for {self.command} {self.path}: {path}")
+            self.send_error(404)
+            return
+        with open(path, mode='rb') as file:
+            content = file.read()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+def serve(fixtures, port):
+    ReplayHandler.fixtures = fixtures
+    server = ThreadingHTTPServer(('127.0.0.1', port), ReplayHandler)
+    logging.info(f"Replaying {fixtures} on http://127.0.0.1:{server.server_port}")
+    return server
+
+def write_fixture(path, markup):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', encoding='utf-8') as file:
+        file.write(markup)
+
+def record_element(driver, i):
+    scrape.safe_click(scrape.scroll_to_list_item(driver, LIBRARIES['elements']['list'], i, LIBRARIES['elements']['pane']))
+    scrape.wait_for_pane_change(driver)
+    markup = scrape.snapshot_html(driver, LIBRARIES['elements']['pane'])
+    cases = {layer['kind'] for layer in parse_element_details(markup)['layers']}
+    return {None: markup}, cases
+
+def record_component(driver, i):
+    scrape.safe_click(scrape.scroll_to_list_item(driver, LIBRARIES['components']['list'], i, selection_details_selector))
+    scrape.wait_for_pane_change(driver)
+    markup = scrape.snapshot_html(driver, selection_details_selector)
+    details = lxml.html.fromstring(markup).cssselect("div.selectionDetails > div")
+    detail_type = next((name for name in COMPONENT_LIVE_SELECTORS if details and name in details[0].get('class', '')), None)
+    if detail_type is None:
+        raise ValueError("Unknown selection detail class")
+
+    # Panes are recorded with their collapsible panels opened, as the live app keeps them open once the scraper opened them
+    tabs = driver.find_elements(By.CSS_SELECTOR, COMPONENT_TABS[detail_type])[1:] if detail_type in COMPONENT_TABS else []
+    if not tabs:
+        scrape.capture_component(driver, detail_type)
+        return {None: scrape.snapshot_html(driver, selection_details_selector)}, {detail_type}
+    panes = {None: markup}
+    for position, tab in enumerate(tabs, start=1):
+        scrape.click_and_wait_for_pane_change(driver, tab, selection_details_selector)
+        scrape.capture_component(driver, detail_type)
+        panes[position] = scrape.snapshot_html(driver, selection_details_selector)
+    cases = {detail_type}
+    if detail_type == 'epdDetails' and len(tabs) > 1:
+        cases.add('multi_tab')
+    return panes, cases
+
+RECORD_ITEM = {
+    'elements': record_element,
+    'components': record_component
+}
+
+def sample_order(total, sample):
+    # Spread over the whole list first, then the items in between. The offset keeps the item that is selected when
+    # the page loads out of a small sample, clicking it would not change the pane.
+    stride = max(total // max(sample, 1), 1)
+    spread = list(range(stride // 2, total, stride))
+    return spread + sorted(set(range(total)) - set(spread))
+
+def static_page(markup, kind, sampled):
+    # The recorded page without the site's scripts and inline handlers, listing only the sampled items
+    library = LIBRARIES[kind]
+    document = lxml.html.fromstring(markup)
+    for node in document.xpath('//script | //link | //noscript | //iframe'):
+        node.drop_tree()
+    for node in document.iter(lxml.etree.Element):
+        for name in [name for name in node.attrib if name.startswith('on')]:
+            del node.attrib[name]
+    items = document.cssselect(library['list'])[0]
+    # Positions count element children only, like `parent.children` in the page
+    for position, child in enumerate([child for child in items if isinstance(child.tag, str)]):
+        if position not in sampled:
+            child.drop_tree()
+
+    config = {'route': f"{DOM_ROUTE}{kind}/", 'list': library['list'], 'pane': library['pane']}
+    script = lxml.html.Element('script')
+    script.text = REPLAY_SCRIPT % json.dumps(config)
+    document.find('body').append(script)
+    return lxml.html.tostring(document, encoding='unicode', doctype='<!DOCTYPE html>')
+
+def record_library(driver, kind, fixtures, sample, max_scan):
+    items = scrape.open_library(driver, kind)
+    page = driver.execute_script("return document.documentElement.outerHTML")
+
+    recorded = {}
+    covered = set()
+    for scanned, i in enumerate(sample_order(len(items), sample)):
+        missing = REQUIRED_CASES[kind] - covered
+        if scanned >= max_scan or (len(recorded) >= sample and not missing):
+            break
+        try:
+            panes, cases = RECORD_ITEM[kind](driver, i)
+        except Exception as e:
+            logging.error(f"Could not record {kind} item {i + 1} '{items[i]['label']}': {e}")
+            traceback.print_exc()
+            continue
+        # Past the sample size only items showing a layout that is still missing are kept
+        if len(recorded) < sample or cases & missing:
+            recorded[i] = (panes, cases)
+            covered |= cases
+
+    if REQUIRED_CASES[kind] - covered:
+        logging.warning(f"No {kind} recorded for {', '.join(sorted(REQUIRED_CASES[kind] - covered))} within {max_scan} items")
+
+    # Items are renumbered by their position in the recorded list, which only holds the sampled items
+    directory = os.path.join(fixtures, kind)
+    manifest = []
+    for position, i in enumerate(sorted(recorded)):
+        panes, cases = recorded[i]
+        for tab, markup in panes.items():
+            write_fixture(os.path.join(directory, 'panes', f"{position}.html" if tab is None else os.path.join(str(position), f"{tab}.html")), markup)
+        manifest.append({'position': position, 'index': i, 'label': items[i]['label'], 'cases': sorted(cases), 'tabs': len(panes) - 1})
+    write_fixture(os.path.join(directory, 'page.html'), static_page(page, kind, set(recorded)))
+    with open(os.path.join(directory, 'sample.json'), mode='w') as file:
+        json.dump(manifest, file, indent=2)
+    logging.info(f"Recorded {len(recorded)} of {len(items)} {kind} to {directory} ({', '.join(sorted(covered))})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded TOTEM responses for offline runs")
+    parser.add_argument('--fixtures', default='fixtures', help="directory recorded with `totem_http.py --record` or `--record`")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--record', action='store_true', help="record the library pages and detail panes of a sample of items with the browser, instead of serving")
+    parser.add_argument('--sample', type=int, default=25, help="items to record per library")
+    parser.add_argument('--max-scan', type=int, default=500, help="items to open per library while looking for missing pane layouts")
+    scrape.add_browser_arguments(parser)
+    args = parser.parse_args()
+
+    if args.record:
+        driver = scrape.start_session(scrape.browser_options(args))
+        try:
+            for kind in LIBRARIES:
+                record_library(driver, kind, args.fixtures, args.sample, args.max_scan)
+        finally:
+            driver.quit()
+        return
+
+    server = serve(args.fixtures, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
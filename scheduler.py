@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import heapq
+import queue
+import logging
+import statistics
+import traceback
+import threading
+from collections import deque
+
+import metrics
+
+# Attempts per item before it counts as failed, and the delay before the second attempt, doubled for every further one
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+# Failed items in a row after which a session counts as degraded. A detail pane that did not update within the timeout
+# fails its item, so repeated timeouts count as well.
+DEGRADED_STREAK = 3
+# A session also counts as degraded once the median of its last items is this many times the median of its first ones
+LATENCY_WINDOW = 10
+LATENCY_FACTOR = 3.0
+
+# Seconds a shard waits on a full queue before it checks again whether the writer stopped
+PUT_INTERVAL = 0.5
+
+# Captures on their way from the shards to the writer, bounded so the browsers cannot run far ahead of it. Once the
+# writer stopped (finished or failed), puts return at once and the shards end after their current item, so joining
+# them cannot hang on a queue nobody drains.
+class CaptureQueue(queue.Queue):
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.stopped = threading.Event()
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                super().put(item, timeout=PUT_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def stop(self):
+        self.stopped.set()
+
+def backoff(attempt):
+    return min(BACKOFF_SECONDS * 2 ** (attempt - 1), MAX_BACKOFF_SECONDS)
+
+# Watches the items of one session for signs that it stopped working or slowed down, e.g. an expired login or a
+# browser that leaks memory over a long run
+class SessionHealth:
+    def __init__(self):
+        self.streak = 0
+        self.baseline = []
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, ok, seconds):
+        self.streak = self.streak + 1 if not ok else 0
+        if ok:
+            if len(self.baseline) < LATENCY_WINDOW:
+                self.baseline.append(seconds)
+            else:
+                self.recent.append(seconds)
+
+    def degraded(self):
+        if self.streak >= DEGRADED_STREAK:
+            return f"{self.streak} items in a row failed or timed out"
+        if len(self.recent) == LATENCY_WINDOW:
+            baseline = statistics.median(self.baseline)
+            recent = statistics.median(self.recent)
+            if recent > LATENCY_FACTOR * baseline:
+                return f"median item time rose from {baseline:.2f}s to {recent:.2f}s"
+        return None
+
+    def reset(self):
+        # The baseline stays, a restarted session is expected to be as fast as the first one
+        self.streak = 0
+        self.recent.clear()
+
+def restart_session(restart, reason):
+    logging.warning(f"Restarting session: {reason}")
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            restart()
+            return
+        except Exception as e:
+            logging.error(f"Session restart {attempt} of {MAX_ATTEMPTS} failed: {e}")
+            if attempt == MAX_ATTEMPTS:
+                raise
+            time.sleep(backoff(attempt))
+
+def attempt_item(scrape_item, i):
+    try:
+        return scrape_item(i)
+    except Exception as e:
+        logging.error(f"Error processing item at {i + 1}: {e}")
+        traceback.print_exc()
+        metrics.set_error(e)
+        return None
+
+def run_with_retries(indices, scrape_item, results, recorder, restart=None):
+    # Scrapes the indices of a shard in order. A failed item (scrape_item returned None) is put back with a growing
+    # delay and taken up again once it is due, between the following items, and is only handed to the writer as
+    # failed after MAX_ATTEMPTS. restart replaces the session of the shard when it looks degraded.
+    health = SessionHealth()
+    retries = []
+    attempts = {}
+    position = 0
+    while (position < len(indices) or retries) and not results.stopped.is_set():
+        if retries and (position == len(indices) or retries[0][0] <= time.monotonic()):
+            due, i = heapq.heappop(retries)
+            if results.stopped.wait(max(due - time.monotonic(), 0)):
+                break
+        else:
+            i = indices[position]
+            position += 1
+        attempts[i] = attempts.get(i, 0) + 1
+
+        recorder.start(i)
+        start = time.perf_counter()
+        capture = attempt_item(scrape_item, i)
+        seconds = time.perf_counter() - start
+        recorder.captured(i)
+
+        health.record(capture is not None, seconds)
+        if capture is None and attempts[i] < MAX_ATTEMPTS:
+            delay = backoff(attempts[i])
+            logging.warning(f"Retrying item {i + 1} in {delay:.0f}s (attempt {attempts[i] + 1} of {MAX_ATTEMPTS})")
+            heapq.heappush(retries, (time.monotonic() + delay, i))
+        else:
+            results.put((i, capture))
+
+        reason = health.degraded()
+        if reason and restart is not None:
+            restart_session(restart, reason)
+            health.reset()
+
+def write_failures(output, items, indices, recorder):
+    # The items of a run that did not reach the output, with what is known about why. A complete run removes the
+    # manifest of an earlier one.
+    path = f"{output}.failures.json"
+    finished = {item['index']: item for item in recorder.finished}
+    failures = []
+    for i in indices:
+        item = finished.get(i) or recorder.items.get(i)
+        failures.append({
+            'index': i,
+            'label': items[i]['label'],
+            'status': item.get('status', 'interrupted') if item else 'not started',
+            'attempts': item['retries'] + 1 if item else 0,
+            'error': item['error'] if item else None
+        })
+    if failures:
+        with open(path, mode='w') as file:
+            json.dump(failures, file, indent=2)
+        logging.warning(f"{len(failures)} items not written, see {path}")
+    elif os.path.isfile(path):
+        os.remove(path)
+    return failures
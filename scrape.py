@@ -1,10 +1,23 @@
 import os
+import io
 import csv
 import re
 import logging
 import traceback
-
+import argparse
+import hashlib
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import lxml.html
 from dotenv import load_dotenv
+import metrics
+from journal import Journal
+from store import Store
+import columnar
+from scheduler import CaptureQueue, run_with_retries, write_failures
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -15,15 +28,136 @@ load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-driver = webdriver.Chrome()
-driver.set_window_size(2400, 1800)
-wait = WebDriverWait(driver, 10)
+BASE_URL = os.getenv("TOTEM_BASE_URL", "https://www.totem-building.be")
+WAIT_TIMEOUT = 10
+SESSION_CACHE = '.totem_session.json'
+logged_in_selector = "#app > div.home-page > div.main-content"
+
+BROWSER_DEFAULTS = {
+    'headless': False,
+    'block_assets': False,
+    'page_load_strategy': 'normal',
+    'session_cache': SESSION_CACHE
+}
+# Blocked through CDP, the scraper only reads text from the DOM
+BLOCKED_ASSETS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp',
+                  '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+                  '*.mp4', '*.webm', '*.ogg', '*.mp3', '*.wav']
+# Time without further mutations after which a detail pane counts as rendered
+PANE_QUIET_MS = 50
+# Captured items waiting to be parsed and written, the browsers block once the writer is this far behind
+CAPTURE_QUEUE_SIZE = 200
+# Items written per flush of the output and the journal
+WRITE_BATCH_SIZE = 50
+
+# Arms a MutationObserver before a click, so the change it causes cannot be missed. A change is either the pane being
+# replaced or a mutation inside it; the selected list entry changing its class does not count. Neither does the
+# selection moving within the tab bar or panel header that was clicked, which sit inside the pane and are updated
+# before the new content is fetched. A click on a list item or tab that is already selected changes nothing, its wait
+# resolves right away instead of running into the timeout.
+ARM_PANE_OBSERVER = """
+    const isSelected = target => target instanceof Element && (target.getAttribute('aria-selected') === 'true'
+        || Array.from(target.classList).some(name => /^(ui-state-)?(selected|active|current)$/i.test(name)));
+    const armPaneObserver = (selector, quietPeriod, target) => {
+        if (isSelected(target)) {
+            window.scrapePaneChange = {change: Promise.resolve(true), cancel: () => {}};
+            return;
+        }
+        const initial = document.querySelector(selector);
+        const controls = target instanceof Element
+            ? target.closest('.applicationUnitSelector, .variantSelector, .headerWrapper') || target.parentElement : null;
+        const isContent = mutation => !(mutation.type === 'attributes' && controls && controls.contains(mutation.target));
+        let quietTimer = null;
+        let resolveChange = null;
+        const change = new Promise(resolve => resolveChange = resolve);
+        const observer = new MutationObserver(mutations => {
+            const current = document.querySelector(selector);
+            if (current === initial && !mutations.some(mutation => current && current.contains(mutation.target) && isContent(mutation))) {
+                return;
+            }
+            clearTimeout(quietTimer);
+            quietTimer = setTimeout(() => {
+                observer.disconnect();
+                resolveChange(true);
+            }, quietPeriod);
+        });
+        observer.observe(document.body, {childList: true, subtree: true, attributes: true, characterData: true});
+        window.scrapePaneChange = {change: change, cancel: () => {
+            observer.disconnect();
+            resolveChange(false);
+        }};
+    };
+"""
+
+ELEMENT_COLUMNS = ['Element Name', 'Element U-Value', 'Layer', 'Composition', 'Ratio', 'Component Name', 'Application', 'Lifetime', 'Thickness']
+COMPONENT_COLUMNS = ['Component Name', 'Application', 'Category', 'Type',
+                     'Database', 'LCI-ID', 'Lambda', 'R-Value', 'U-Value', 'Min Density', 'Max Density',
+                     'Functional Unit', 'Type of Assembly', 'Material', 'Waste Category', 'Landfill',
+                     'Incineration', 'Reuse', 'Recycling', 'Sorted on Building Site']
+
+elements_base_selector = "#app > div.library > div.libraryDetail.ELEMENTTYPE > div > div.south-part"
+elements_list_selector = f"{elements_base_selector} > div.filterAndList > div.listArea > div.listWrapper > div.list"
+elements_selector = f"{elements_list_selector} > div"
+element_pane_selector = f"{elements_base_selector} > div.selectionDetails"
+element_details_selector = f"{element_pane_selector} > div.etLibraryObject"
+
+components_base_selector = "#app > div.library > div.libraryDetail.COMPONENT > div > div.south-part"
+components_list_selector = f"{components_base_selector} > div.filterAndList > div.listArea > div.listWrapper > div"
+components_selector = f"{components_list_selector} > div"
+# Only text fields, the filter area also holds checkboxes
+components_search_selector = ", ".join(f"{components_base_selector} > div.filterAndList input{kind}" for kind in (":not([type])", "[type='text']", "[type='search']"))
+selection_details_selector = f"{components_base_selector} > div.selectionDetails"
+application_unit_selector = f"{selection_details_selector} > div.epdDetails > div.applicationUnitSelector"
+
+# Selectors relative to the root of a detail pane snapshot, see parse_element_details / parse_component_details
+ELEMENT_SNAPSHOT_SELECTORS = {
+    'name': "div.propertiesAndImage > div > span.property.name > span.value",
+    'u_value': "div.propertiesAndImage > div > span.property.uvalue > span.value",
+    'layers': "div.layerTable > div.layerTableScroll > div.rowGroups > div.rows > div.layerWrapper"
+}
+
+COMPONENT_PROPERTY_LABELS = {
+    "Category": 'category',
+    "Type": 'type',
+    "Database": 'database',
+    "ID": 'lci_id',
+    "Lambda": 'lambda',
+    "R-value": 'r_value',
+    "U-value": 'u_value',
+    "Density": 'density',
+    "Functional unit": 'functional_unit'
+}
+
+def component_type_selectors(details_selector, panels_selector):
+    return {
+        'name': f"{details_selector} > span.title > span.name",
+        'application': f"{details_selector} > span.title > span.category",
+        'properties': f"{panels_selector} > div.collapsiblePanel > div.content > div.properties",
+        'reversibility_toggle_path': f"{panels_selector} > div.collapsiblePanel.reversibility",
+        'type_of_assembly': f"{panels_selector} > div.collapsiblePanel.reversibility > div.content > div.typeOfAssembly > div.type > span.value",
+        'end_of_life_toggle_path': f"{panels_selector} > div.collapsiblePanel.endOfLife",
+        'materials': f"{panels_selector} > div.collapsiblePanel.endOfLife > div.content > table > tbody > tr"
+    }
+
+def component_detail_selectors(root_selector):
+    application_unit_details = f"{root_selector} > div.epdDetails > div.applicationUnitDetails"
+    worksection_details = f"{root_selector} > div.worksectionDetails"
+    worksection_grouped_details = f"{root_selector} > div.groupDetails > div.worksectionDetails"
+    return {
+        'epdDetails': component_type_selectors(application_unit_details, application_unit_details),
+        'worksectionDetails': component_type_selectors(worksection_details, f"{worksection_details} > div"),
+        'groupDetails': component_type_selectors(worksection_grouped_details, f"{worksection_grouped_details} > div")
+    }
+
+# Live selectors are used to click and wait in the browser, snapshot selectors to parse a captured selectionDetails pane
+COMPONENT_LIVE_SELECTORS = component_detail_selectors(selection_details_selector)
+COMPONENT_SNAPSHOT_SELECTORS = component_detail_selectors("div.selectionDetails")
 
 def from_percentage_to_number(percentage):
     try:
         return round(float(percentage.rstrip('%')) * 0.01, 3)
     except ValueError:
-        raise ValueError(f"Could not convert percentage to number: {percentage}")    
+        raise ValueError(f"Could not convert percentage to number: {percentage}")
 
 def find_min_max_number_in_string(string):
     match = re.search(r"(\d+)\s*-\s*(\d+)\s*kg/m³", string)
@@ -59,399 +193,738 @@ def format_functional_unit(functional_unit):
     logging.warning(f"Unknown functional unit: {functional_unit}")
     return functional_unit
 
+def node_text(node):
+    # Mirrors WebElement.text, which trims and collapses the rendered whitespace
+    return " ".join(node.text_content().split())
+
+def select_text(node, selector):
+    matches = node.cssselect(selector)
+    return node_text(matches[0]) if matches else None
+
+def parse_element_details(markup):
+    root = lxml.html.fromstring(markup)
+    layers = []
+    for layer_element in root.cssselect(ELEMENT_SNAPSHOT_SELECTORS['layers']):
+        layer_classes = layer_element.get("class", "")
+        if "homogeneous" in layer_classes:
+            layers.append({
+                'kind': 'homogeneous',
+                'layer': select_text(layer_element, "div > span.identifier"),
+                'parts': [{
+                    'composition': "a",
+                    'ratio': None,
+                    'name': select_text(layer_element, "div > span.name"),
+                    'application': select_text(layer_element, "div > span.category"),
+                    'lifetime': select_text(layer_element, "div > div.properties > div.lifetime"),
+                    'thickness': select_text(layer_element, "div > div.properties > div.param1")
+                }]
+            })
+        elif "heterogeneous" in layer_classes:
+            layers.append({
+                'kind': 'heterogeneous',
+                'layer': select_text(layer_element, "div.heterogeneous > span.identifier"),
+                'parts': [{
+                    'composition': select_text(sublayer, "span.identifier"),
+                    'ratio': select_text(sublayer, "span.surfaceWeight"),
+                    'name': select_text(sublayer, "span.name"),
+                    'application': select_text(sublayer, "span.category"),
+                    'lifetime': select_text(sublayer, "div.properties > div.lifetime"),
+                    'thickness': select_text(sublayer, "div.properties > div.param1")
+                } for sublayer in layer_element.cssselect("div.heterogeneous > div.sublayer")]
+            })
+        else:
+            layers.append({'kind': layer_classes, 'layer': None, 'parts': []})
+    return {
+        'name': select_text(root, ELEMENT_SNAPSHOT_SELECTORS['name']),
+        'u_value': select_text(root, ELEMENT_SNAPSHOT_SELECTORS['u_value']),
+        'layers': layers
+    }
+
+def element_rows(record):
+    element_name = record['name']
+    try:
+        element_u_value = find_number_in_string(record['u_value'])
+    except:
+        # logging.info(f"No U-value found for element '{element_name}'")
+        element_u_value = None
+
+    rows = []
+    for layer in record['layers']:
+        if layer['kind'] not in ('homogeneous', 'heterogeneous'):
+            raise ValueError(f"Unknown component class: '{layer['kind']}'")
+        for part in layer['parts']:
+            if None in (layer['layer'], part['composition'], part['name'], part['application'], part['lifetime']):
+                logging.error(f"Failed to scrape component for element '{element_name}': incomplete layer '{layer['layer']}'")
+                continue
+            if layer['kind'] == 'homogeneous':
+                composition = part['composition']
+                ratio = 1
+            else:
+                composition = part['composition'][:-1]
+                ratio = from_percentage_to_number(part['ratio'])
+            try:
+                thickness = find_number_in_string(part['thickness'])
+            except:
+                # logging.info(f"No thickness found for:\n  element '{element_name}'\n  component '{name}' - '{application}'")
+                thickness = None
+
+            rows.append([
+                element_name,
+                element_u_value,
+                layer['layer'],
+                composition,
+                ratio,
+                part['name'],
+                part['application'],
+                find_number_in_string(part['lifetime']),
+                thickness
+                ])
+    return rows
+
+def parse_component_details(markup, detail_type):
+    root = lxml.html.fromstring(markup)
+    detail_selectors = COMPONENT_SNAPSHOT_SELECTORS[detail_type]
+
+    properties = {key: None for key in COMPONENT_PROPERTY_LABELS.values()}
+    for property_element in root.cssselect(f"{detail_selectors['properties']} span.property"):
+        label_text = select_text(property_element, "span.label")
+        if label_text not in COMPONENT_PROPERTY_LABELS:
+            continue
+        properties[COMPONENT_PROPERTY_LABELS[label_text]] = select_text(property_element, "span.value")
+    if properties['density'] in ["Not applicable", "Unknown"]:
+        properties['density'] = None
+
+    return {
+        'detail_type': detail_type,
+        'name': select_text(root, detail_selectors['name']),
+        'application': select_text(root, detail_selectors['application']),
+        'properties': properties,
+        'has_reversibility': len(root.cssselect(detail_selectors['reversibility_toggle_path'])) == 1,
+        'is_reversibility_open': len(root.cssselect(f"{detail_selectors['reversibility_toggle_path']} > div.headerWrapper > span.button.open")) == 1,
+        'type_of_assembly': [node_text(node) for node in root.cssselect(detail_selectors['type_of_assembly'])],
+        'has_end_of_life': len(root.cssselect(detail_selectors['end_of_life_toggle_path'])) == 1,
+        'is_end_of_life_open': len(root.cssselect(f"{detail_selectors['end_of_life_toggle_path']} > div.headerWrapper > span.button.open")) == 1,
+        'materials': [{
+            'description': select_text(material, "td.description"),
+            'waste_category': select_text(material, "td.wsn"),
+            'landfill': select_text(material, "td.landfill"),
+            'incineration': select_text(material, "td.incineration"),
+            'reuse': select_text(material, "td.reuse"),
+            'recycling': select_text(material, "td.recycling"),
+            'sorted_on_site': select_text(material, "td.sorted")
+        } for material in root.cssselect(detail_selectors['materials'])]
+    }
+
+def component_rows(record):
+    component_identifier = f"'{record['name']}' - '{record['application']}'"
+    properties = record['properties']
+
+    if not record['has_reversibility']:
+        logging.info(f"Reversibility toggle not found for '{component_identifier}'")
+        type_of_assembly = None
+    elif len(record['type_of_assembly']) != 1:
+        logging.info(f"Type of assembly not found for '{component_identifier}'")
+        type_of_assembly = None
+    else:
+        type_of_assembly = record['type_of_assembly'][0]
+
+    if not record['has_end_of_life']:
+        logging.info(f"End of life toggle not found for '{component_identifier}'")
+    elif len(record['materials']) == 0:
+        logging.info(f"No materials found for '{component_identifier}'")
+
+    rows = []
+    for material in record['materials']:
+        min_density, max_density = find_min_max_number_in_string(properties['density']) if properties['density'] else (None, None)
+        rows.append([
+            record['name'],
+            record['application'],
+            properties['category'],
+            properties['type'],
+            properties['database'],
+            properties['lci_id'],
+            find_number_in_string(properties['lambda']) if properties['lambda'] else None,
+            find_number_in_string(properties['r_value']) if properties['r_value'] else None,
+            find_number_in_string(properties['u_value']) if properties['u_value'] else None,
+            min_density,
+            max_density,
+            format_functional_unit(properties['functional_unit']),
+            type_of_assembly,
+            material['description'],
+            material['waste_category'],
+            from_percentage_to_number(material['landfill']),
+            from_percentage_to_number(material['incineration']),
+            from_percentage_to_number(material['reuse']),
+            from_percentage_to_number(material['recycling']),
+            from_percentage_to_number(material['sorted_on_site']) if "%" in material['sorted_on_site'] else material['sorted_on_site']
+        ])
+    return rows
+
+def create_driver(browser=BROWSER_DEFAULTS):
+    options = webdriver.ChromeOptions()
+    options.add_argument("--window-size=2400,1800")
+    options.page_load_strategy = browser['page_load_strategy']
+    if browser['headless']:
+        options.add_argument("--headless=new")
+    if browser['block_assets']:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--mute-audio")
+
+    driver = webdriver.Chrome(options=options)
+    driver.execute = metrics.count_commands(driver.execute)
+    driver.set_script_timeout(WAIT_TIMEOUT + 5)
+    if browser['block_assets']:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {'urls': BLOCKED_ASSETS})
+    return driver
+
+def element_capture_rows(markup):
+    record = parse_element_details(markup)
+    if record['name'] is None:
+        raise ValueError("Element details did not render")
+    return element_rows(record)
+
+def component_capture_rows(records):
+    rows = []
+    for record in records:
+        rows.extend(component_rows(record))
+    return rows
+
+def validate_rows(rows, columns, key_columns):
+    for row in rows:
+        if len(row) != len(columns):
+            raise ValueError(f"Row has {len(row)} values instead of {len(columns)}: {row}")
+        if any(value in (None, "") for value in row[:key_columns]):
+            raise ValueError(f"Row without {' / '.join(columns[:key_columns])}: {row}")
+    return rows
+
 def safe_click(element):
     try:
-        element.click()
+        with metrics.phase('click'):
+            element.click()
     except (StaleElementReferenceException, NoSuchElementException) as e:
         logging.error(f"Error clicking element: {e}")
         traceback.print_exc()
 
-def wait_for_element(selector, by=By.CSS_SELECTOR):
-    return wait.until(EC.presence_of_element_located((by, selector)))
+def wait_for_element(driver, selector, by=By.CSS_SELECTOR):
+    return WebDriverWait(driver, WAIT_TIMEOUT).until(EC.presence_of_element_located((by, selector)))
+
+def scroll_to_list_item(driver, list_selector, i, pane_selector):
+    # Looks the item up by position in the list's children, so the cost per item does not grow with the list and no
+    # handles for the other items are transferred. The returned handle is fresh, which also avoids stale references.
+    # The same round trip arms the observer for the detail pane the click on the item is going to update.
+    with metrics.phase('click'):
+        return driver.execute_script(ARM_PANE_OBSERVER + """
+            const parent = document.querySelector(arguments[0]);
+            const child = parent.children[arguments[1]];
+            armPaneObserver(arguments[2], arguments[3], child);
+            parent.scrollTop = child.offsetTop - parent.offsetTop;
+            return child;
+        """, list_selector, i, pane_selector, PANE_QUIET_MS)
+
+def arm_pane_observer(driver, pane_selector, target=None):
+    with metrics.phase('click'):
+        driver.execute_script(ARM_PANE_OBSERVER + "armPaneObserver(arguments[0], arguments[1], arguments[2]);", pane_selector, PANE_QUIET_MS, target)
+
+def wait_for_pane_change(driver, timeout=WAIT_TIMEOUT):
+    # Returns as soon as the armed observer saw the pane settle, or right away for a target that was already
+    # selected. A pane that did not change within the timeout still shows the previous item, which must not be read.
+    with metrics.phase('wait'):
+        changed = driver.execute_async_script("""
+            const done = arguments[arguments.length - 1];
+            const pending = window.scrapePaneChange;
+            if (!pending) {
+                done(false);
+                return;
+            }
+            const timer = setTimeout(pending.cancel, arguments[0]);
+            pending.change.then(changed => {
+                clearTimeout(timer);
+                window.scrapePaneChange = null;
+                done(changed);
+            });
+        """, timeout * 1000)
+    if not changed:
+        metrics.count('pane_timeouts')
+        raise TimeoutException(f"Detail pane did not change within {timeout}s")
+
+def click_and_wait_for_pane_change(driver, element, pane_selector):
+    arm_pane_observer(driver, pane_selector, element)
+    safe_click(element)
+    wait_for_pane_change(driver)
+
+def snapshot_html(driver, selector):
+    # One WebDriver round trip for the whole pane instead of one per label, value and table cell
+    with metrics.phase('extract'):
+        return driver.execute_script("""
+            const node = document.querySelector(arguments[0]);
+            return node ? node.outerHTML : null;
+        """, selector)
+
+def login(driver):
+    logging.info("Logging in...")
+    driver.get(BASE_URL)
+
+    wait_for_element(driver, "//*[@id='app']/div[1]/div[2]/div[2]/div[2]/div", By.XPATH).click()
 
-def scroll_to_element(parent, child):
-    driver.execute_script("""
-        const parent = arguments[0];
-        const child = arguments[1];
-        parent.scrollTop = child.offsetTop - parent.offsetTop;
-    """, parent, child)
+    email_input = wait_for_element(driver, "//*[@id='app']/div[1]/div[2]/div[2]/div[2]/div/span[1]/span[2]/input", By.XPATH)
+    password_input = wait_for_element(driver, "//*[@id='app']/div[1]/div[2]/div[2]/div[2]/div/span[2]/span[2]/input", By.XPATH)
+    login_button = wait_for_element(driver, "//*[@id='app']/div[1]/div[2]/div[2]/div[3]/div[1]/div[2]", By.XPATH)
 
-def login():
-    logging.info("Logging in...")
-    driver.get("https://www.totem-building.be")
-    
-    wait_for_element("//*[@id='app']/div[1]/div[2]/div[2]/div[2]/div", By.XPATH).click()
-
-    email_input = wait_for_element("//*[@id='app']/div[1]/div[2]/div[2]/div[2]/div/span[1]/span[2]/input", By.XPATH)
-    password_input = wait_for_element("//*[@id='app']/div[1]/div[2]/div[2]/div[2]/div/span[2]/span[2]/input", By.XPATH)
-    login_button = wait_for_element("//*[@id='app']/div[1]/div[2]/div[2]/div[3]/div[1]/div[2]", By.XPATH)
-    
     email_input.send_keys(os.getenv("TOTEM_USERNAME"))
     password_input.send_keys(os.getenv("TOTEM_PASSWORD"))
     safe_click(login_button)
 
-    wait_for_element("#app > div.home-page > div.main-content")
+    wait_for_element(driver, logged_in_selector)
     logging.info("Successfully logged in")
 
-def scrape_elements():
-    logging.info("Scraping elements...")
-    driver.get("https://www.totem-building.be/user.library.xhtml?l=ELEMENTTYPE")
-    
-    elements_base_selector = "#app > div.library > div.libraryDetail.ELEMENTTYPE > div > div.south-part"
-    elements_list_selector = f"{elements_base_selector} > div.filterAndList > div.listArea > div.listWrapper > div.list"
-    elements_selector = f"{elements_list_selector} > div"
-    element_details_selector = f"{elements_base_selector} > div.selectionDetails > div.etLibraryObject"
-
-    wait_for_element(f"{element_details_selector} > div.propertiesAndImage > div > span.property.name > span.value")
-
-    elements_list = driver.find_element(By.CSS_SELECTOR, elements_list_selector)
-    elements = driver.find_elements(By.CSS_SELECTOR, elements_selector)
-
-    logging.info(driver.find_element(By.CSS_SELECTOR, f"{elements_base_selector} > div.filterAndList > div.listArea > div.listAreaTitle > span.totalSize").text)
-    logging.info(f"Elements in list: {len(elements)}")
-
-    with open('elements.csv', mode='w', newline='') as file:
-        writer = csv.writer(file, delimiter=';')
-        writer.writerow(['Element Name', 'Element U-Value', 'Layer', 'Composition', 'Ratio', 'Component Name', 'Application', 'Lifetime', 'Thickness'])
-
-        for i in range(len(elements)):
+def load_cached_cookies(path=SESSION_CACHE):
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as file:
+            cookies = json.load(file)
+    except ValueError as e:
+        # e.g. cut off by a crash, logging in again replaces it
+        logging.warning(f"Ignoring unreadable session cache {path}: {e}")
+        return None
+    # Cookies without expiry live as long as the server side session, which is checked on use
+    if any('expiry' in cookie and cookie['expiry'] <= time.time() for cookie in cookies):
+        logging.info("Cached session expired")
+        return None
+    return cookies
+
+def save_cached_cookies(cookies, path=SESSION_CACHE):
+    if not path:
+        return
+    # Sessions log in concurrently, the rename keeps the cache readable at all times. The cookies are a live login,
+    # readable by the owner only.
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with os.fdopen(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), mode='w') as file:
+        json.dump(cookies, file)
+    os.replace(temporary_path, path)
+
+def restore_session(driver, cookies):
+    # Cookies can only be set for the domain that is currently loaded
+    driver.get(BASE_URL)
+    for cookie in cookies:
+        driver.add_cookie({key: value for key, value in cookie.items() if key in ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry', 'sameSite')})
+    driver.get(BASE_URL)
+    try:
+        WebDriverWait(driver, 3).until(EC.presence_of_element_located((By.CSS_SELECTOR, logged_in_selector)))
+    except TimeoutException:
+        return False
+    logging.info("Restored cached session")
+    return True
+
+def start_session(browser=BROWSER_DEFAULTS):
+    driver = create_driver(browser)
+    try:
+        cookies = load_cached_cookies(browser['session_cache'])
+        if cookies is None or not restore_session(driver, cookies):
+            driver.delete_all_cookies()
+            login(driver)
+            save_cached_cookies(driver.get_cookies(), browser['session_cache'])
+    except Exception:
+        driver.quit()
+        raise
+    return driver
+
+def start_sessions(browser, workers):
+    sessions = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(start_session, browser) for _ in range(workers)]
+        for future in futures:
             try:
-                # Re-fetch to avoid StaleElementReferenceException
-                elements = driver.find_elements(By.CSS_SELECTOR, elements_selector)
-                element = elements[i]
-
-                # Update element details
-                safe_click(element)
-                scroll_to_element(elements_list, element)
-
-                # Scrape
-                element_name = wait_for_element(f"{element_details_selector} > div.propertiesAndImage > div > span.property.name > span.value").text                
-                try:
-                    element_u_value = driver.find_element(By.CSS_SELECTOR, f"{element_details_selector} > div.propertiesAndImage > div > span.property.uvalue > span.value")
-                    element_u_value = find_number_in_string(element_u_value.text)
-                except:
-                    # logging.info(f"No U-value found for element '{element_name}'")
-                    element_u_value = None
-
-                components = driver.find_elements(By.CSS_SELECTOR, f"{element_details_selector} > div.layerTable > div.layerTableScroll > div.rowGroups > div.rows > div.layerWrapper")
-                for component in components:
-                    try:
-                        component_classes = component.get_attribute("class")
-                        if "homogeneous" in component_classes:
-                            layer = component.find_element(By.CSS_SELECTOR, "div > span.identifier").text
-                            composition = "a"
-                            ratio = 1
-                            name = component.find_element(By.CSS_SELECTOR, "div > span.name").text
-                            application = component.find_element(By.CSS_SELECTOR, "div > span.category").text
-                            lifetime = find_number_in_string(component.find_element(By.CSS_SELECTOR, "div > div.properties > div.lifetime").text)
-                            try:
-                                thickness = find_number_in_string(component.find_element(By.CSS_SELECTOR, "div > div.properties > div.param1").text)
-                            except:
-                                # logging.info(f"No thickness found for:\n  element '{element_name}'\n  component '{name}' - '{application}'")
-                                thickness = None
-
-                            writer.writerow([
-                                element_name, 
-                                element_u_value,
-                                layer,
-                                composition,
-                                ratio,
-                                name,
-                                application,
-                                lifetime,
-                                thickness
-                                ])
-                        elif "heterogeneous" in component_classes:
-                            layer = component.find_element(By.CSS_SELECTOR, "div.heterogeneous > span.identifier").text
-                            
-                            sublayers = component.find_elements(By.CSS_SELECTOR, "div.heterogeneous > div.sublayer")
-                            for sublayer in sublayers:
-                                composition = sublayer.find_element(By.CSS_SELECTOR, "span.identifier").text[:-1]
-                                ratio = from_percentage_to_number(sublayer.find_element(By.CSS_SELECTOR, "span.surfaceWeight").text)
-                                name = sublayer.find_element(By.CSS_SELECTOR, "span.name").text
-                                application = sublayer.find_element(By.CSS_SELECTOR, "span.category").text
-                                lifetime = find_number_in_string(sublayer.find_element(By.CSS_SELECTOR, "div.properties > div.lifetime").text)
-                                try:
-                                    thickness = find_number_in_string(sublayer.find_element(By.CSS_SELECTOR, "div.properties > div.param1").text)
-                                except:
-                                    # logging.info(f"No thickness found for:\n  element '{element_name}'\n  component '{name}' - '{application}'")
-                                    thickness = None
-
-                                writer.writerow([
-                                    element_name, 
-                                    element_u_value,
-                                    layer,
-                                    composition,
-                                    ratio,
-                                    name,
-                                    application,
-                                    lifetime,
-                                    thickness
-                                    ])
-                        else:
-                            raise ValueError(f"Unknown component class: '{component_classes}'")
-                    except (NoSuchElementException, TimeoutException) as e:
-                        logging.error(f"Failed to scrape component for element '{element_name}': {e}")
-                        traceback.print_exc()
+                sessions.append(future.result())
             except Exception as e:
-                logging.error(f"Error processing element '{element_name}' at {i + 1}: {e}")
-                traceback.print_exc()
-
-    logging.info("Finished scraping elements")
-
-
-def scrape_components():
-    components_base_selector = "#app > div.library > div.libraryDetail.COMPONENT > div > div.south-part"
-    components_list_selector = f"{components_base_selector} > div.filterAndList > div.listArea > div.listWrapper > div"
-    components_selector = f"{components_list_selector} > div"
-    selection_details_selector = f"{components_base_selector} > div.selectionDetails"
-    
-    application_unit_selector = f"{selection_details_selector} > div.epdDetails > div.applicationUnitSelector"
-    application_unit_details = f"{selection_details_selector} > div.epdDetails > div.applicationUnitDetails"
-    application_unit_type_selectors = {
-        'name': f"{application_unit_details} > span.title > span.name",
-        'application': f"{application_unit_details} > span.title > span.category",
-        'properties': f"{application_unit_details} > div.collapsiblePanel > div.content > div.properties",
-        'reversibility_toggle_path': f"{application_unit_details} > div.collapsiblePanel.reversibility",
-        'type_of_assembly': f"{application_unit_details} > div.collapsiblePanel.reversibility > div.content > div.typeOfAssembly > div.type > span.value",
-        'end_of_life_toggle_path': f"{application_unit_details} > div.collapsiblePanel.endOfLife",
-        'materials': f"{application_unit_details} > div.collapsiblePanel.endOfLife > div.content > table > tbody > tr"
-    }
-
-    worksection_details_selector = f"{selection_details_selector} > div.worksectionDetails"
-    worksection_type_selectors = {
-        'name': f"{worksection_details_selector} > span.title > span.name",
-        'application': f"{worksection_details_selector} > span.title > span.category",
-        'properties': f"{worksection_details_selector} > div > div.collapsiblePanel > div.content > div.properties",
-        'reversibility_toggle_path': f"{worksection_details_selector} > div > div.collapsiblePanel.reversibility",
-        'type_of_assembly': f"{worksection_details_selector} > div > div.collapsiblePanel.reversibility > div.content > div.typeOfAssembly > div.type > span.value",
-        'end_of_life_toggle_path': f"{worksection_details_selector} > div > div.collapsiblePanel.endOfLife",
-        'materials': f"{worksection_details_selector} > div > div.collapsiblePanel.endOfLife > div.content > table > tbody > tr"
-    }
-
-    worksection_grouped_details_selector = f"{selection_details_selector} > div.groupDetails > div.worksectionDetails"
-    worksection_grouped_type_selectors = {
-        'name': f"{worksection_grouped_details_selector} > span.title > span.name",
-        'application': f"{worksection_grouped_details_selector} > span.title > span.category",
-        'properties': f"{worksection_grouped_details_selector} > div > div.collapsiblePanel > div.content > div.properties",
-        'reversibility_toggle_path': f"{worksection_grouped_details_selector} > div > div.collapsiblePanel.reversibility",
-        'type_of_assembly': f"{worksection_grouped_details_selector} > div > div.collapsiblePanel.reversibility > div.content > div.typeOfAssembly > div.type > span.value",
-        'end_of_life_toggle_path': f"{worksection_grouped_details_selector} > div > div.collapsiblePanel.endOfLife",
-        'materials': f"{worksection_grouped_details_selector} > div > div.collapsiblePanel.endOfLife > div.content > table > tbody > tr"
+                logging.error(f"Could not start browser session: {e}")
+    if not sessions:
+        raise RuntimeError("No browser session could be started")
+    return sessions
+
+def add_browser_arguments(parser):
+    parser.add_argument('--headless', action='store_true', help="run Chrome without a window")
+    parser.add_argument('--block-assets', action='store_true', help="do not load images, fonts and media")
+    parser.add_argument('--page-load-strategy', choices=['normal', 'eager', 'none'], default='normal',
+                        help="'eager' continues once the DOM is ready, without waiting for the remaining resources")
+    parser.add_argument('--no-session-cache', action='store_true', help=f"always log in instead of reusing the cookies in {SESSION_CACHE}")
+
+def open_store(args):
+    return Store(args.sqlite, {kind: library['columns'] for kind, library in LIBRARIES.items()}) if args.sqlite else None
+
+def browser_options(args):
+    return {
+        'headless': args.headless,
+        'block_assets': args.block_assets,
+        'page_load_strategy': args.page_load_strategy,
+        'session_cache': None if args.no_session_cache else SESSION_CACHE
     }
 
+def scrape_element(driver, i):
+    try:
+        # Update element details
+        metrics.set_branch('etLibraryObject')
+        safe_click(scroll_to_list_item(driver, elements_list_selector, i, element_pane_selector))
+        wait_for_pane_change(driver)
 
-    def extract_component_properties(component_detail_selectors):
-        properties = {
-            'category': None,
-            'type': None,
-            'database': None,
-            'lci_id': None,
-            'lambda': None,
-            'r_value': None,
-            'u_value': None,
-            'density': None,
-            'functional_unit': None
-        }
-        property_elements = driver.find_elements(By.CSS_SELECTOR, component_detail_selectors['properties'])
-        for property_element in property_elements:
-            for sub_element in property_element.find_elements(By.CSS_SELECTOR, "span.property"):
-                label_element = sub_element.find_element(By.CSS_SELECTOR, "span.label")
-                if not label_element:
-                    continue
-                label_text = label_element.text.strip()
-
-                if label_text == "Category":
-                    properties['category'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "Type":
-                    properties['type'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "Database":
-                    properties['database'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "ID":
-                    properties['lci_id'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "Lambda":
-                    properties['lambda'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "R-value":
-                    properties['r_value'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "U-value":
-                    properties['u_value'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                elif label_text == "Density":
-                    properties['density'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-                    if properties['density'] in ["Not applicable", "Unknown"]:
-                        properties['density'] = None
-                elif label_text == "Functional unit":
-                    properties['functional_unit'] = sub_element.find_element(By.CSS_SELECTOR, "span.value").text
-        return properties
-    
-    def extract_component_type_of_assembly(component_identifier, detail_selectors):
-        has_reversibility = len(driver.find_elements(By.CSS_SELECTOR, detail_selectors['reversibility_toggle_path'])) == 1
-        if not has_reversibility:
-            logging.info(f"Reversibility toggle not found for '{component_identifier}'")
-            return None
-
-        is_reversibility_open = len(driver.find_elements(By.CSS_SELECTOR, f"{detail_selectors['reversibility_toggle_path']} > div.headerWrapper > span.button.open")) == 1
-        if not is_reversibility_open:
-            reversibility_toggle = driver.find_element(By.CSS_SELECTOR, f"{detail_selectors['reversibility_toggle_path']} > div.headerWrapper > span.header")
-            safe_click(reversibility_toggle)
-            wait_for_element(f"{detail_selectors['reversibility_toggle_path']} > div.headerWrapper > span.button.open")
-
-        type_of_assembly = driver.find_elements(By.CSS_SELECTOR, detail_selectors['type_of_assembly'])
-        if len(type_of_assembly) != 1:
-            logging.info(f"Type of assembly not found for '{component_identifier}'")
-            return None
-        
-        return type_of_assembly[0].text
-    
-    def extract_component_materials(component_identifier, detail_selectors):
-        material_data = []
-
-        has_end_of_life = len(driver.find_elements(By.CSS_SELECTOR, detail_selectors['end_of_life_toggle_path'])) == 1
-        if not has_end_of_life:
-            logging.info(f"End of life toggle not found for '{component_identifier}'")
-            return material_data
-
-        is_end_of_life_open = len(driver.find_elements(By.CSS_SELECTOR, f"{detail_selectors['end_of_life_toggle_path']} > div.headerWrapper > span.button.open")) == 1
-        if not is_end_of_life_open:
-            end_of_life_toggle = driver.find_element(By.CSS_SELECTOR, f"{detail_selectors['end_of_life_toggle_path']} > div.headerWrapper > span.header")
-            safe_click(end_of_life_toggle)
-            wait_for_element(f"{detail_selectors['end_of_life_toggle_path']} > div.headerWrapper > span.button.open")
-        
-        materials = driver.find_elements(By.CSS_SELECTOR, detail_selectors['materials'])
-        if len(materials) == 0:
-            logging.info(f"No materials found for '{component_identifier}'")
-            return material_data
-        
-        for material in materials:
-            material_data.append({
-                'description': material.find_element(By.CSS_SELECTOR, "td.description").text,
-                'waste_category': material.find_element(By.CSS_SELECTOR, "td.wsn").text,
-                'landfill': material.find_element(By.CSS_SELECTOR, "td.landfill").text,
-                'incineration': material.find_element(By.CSS_SELECTOR, "td.incineration").text,
-                'reuse': material.find_element(By.CSS_SELECTOR, "td.reuse").text,
-                'recycling': material.find_element(By.CSS_SELECTOR, "td.recycling").text,
-                'sorted_on_site': material.find_element(By.CSS_SELECTOR, "td.sorted").text
-            })
-        return material_data
-
-    def scrape_component(detail_selectors):
-        component_name = wait_for_element(detail_selectors['name']).text                
-        component_application = wait_for_element(detail_selectors['application']).text
-        component_identifier = f"'{component_name}' - '{component_application}'"
-        properties = extract_component_properties(detail_selectors)
-        type_of_assembly = extract_component_type_of_assembly(component_identifier, detail_selectors)
-        materials = extract_component_materials(component_identifier, detail_selectors)
-
-        for material in materials:
-            min_density, max_density = find_min_max_number_in_string(properties['density']) if properties['density'] else (None, None)
-            writer.writerow([
-                component_name,
-                component_application,
-                properties['category'],
-                properties['type'],
-                properties['database'],
-                properties['lci_id'],
-                find_number_in_string(properties['lambda']) if properties['lambda'] else None,
-                find_number_in_string(properties['r_value']) if properties['r_value'] else None,
-                find_number_in_string(properties['u_value']) if properties['u_value'] else None,
-                min_density,
-                max_density,
-                format_functional_unit(properties['functional_unit']),
-                type_of_assembly,
-                material['description'],
-                material['waste_category'],
-                from_percentage_to_number(material['landfill']),
-                from_percentage_to_number(material['incineration']),
-                from_percentage_to_number(material['reuse']),
-                from_percentage_to_number(material['recycling']),
-                from_percentage_to_number(material['sorted_on_site']) if "%" in material['sorted_on_site'] else material['sorted_on_site']
-            ])
-
-    logging.info("Scraping components...")
-    driver.get("https://www.totem-building.be/user.library.xhtml?l=COMPONENT")
-    wait_for_element(application_unit_details)
-
-    components_list = driver.find_element(By.CSS_SELECTOR, components_list_selector)
-    components = driver.find_elements(By.CSS_SELECTOR, components_selector)
-
-    logging.info(driver.find_element(By.CSS_SELECTOR, f"{components_base_selector} > div.filterAndList > div.listArea > div.listAreaTitle > span.totalSize").text)
-    logging.info(f"Elements in list: {len(components)}")
-
-    counter = 0
-    with open('components.csv', mode='w', newline='') as file:
-        writer = csv.writer(file, delimiter=';')
-        writer.writerow(['Component Name', 'Application', 'Category', 'Type', 
-                         'Database', 'LCI-ID', 'Lambda', 'R-Value', 'U-Value', 'Min Density', 'Max Density',
-                         'Functional Unit', 'Type of Assembly', 'Material', 'Waste Category', 'Landfill', 
-                         'Incineration', 'Reuse', 'Recycling', 'Sorted on Building Site'])
+        # Parsing happens in the writer, the browser moves on to the next item right away
+        return snapshot_html(driver, element_details_selector)
+    except Exception as e:
+        logging.error(f"Error processing element at {i + 1}: {e}")
+        traceback.print_exc()
+        metrics.set_error(e)
+        return None
+
+def capture_component(driver, detail_type):
+    detail_selectors = COMPONENT_LIVE_SELECTORS[detail_type]
+    markup = snapshot_html(driver, selection_details_selector)
+    with metrics.phase('extract'):
+        record = parse_component_details(markup, detail_type)
+    if record['name'] is None or record['application'] is None:
+        raise ValueError(f"Component details did not render for '{detail_type}'")
+
+    # Collapsed panels are opened once and then stay open for the following items, so a second snapshot is rare
+    toggled = False
+    for has_panel, is_open, toggle_path in [
+        ('has_reversibility', 'is_reversibility_open', 'reversibility_toggle_path'),
+        ('has_end_of_life', 'is_end_of_life_open', 'end_of_life_toggle_path')
+    ]:
+        if record[has_panel] and not record[is_open]:
+            toggle = driver.find_element(By.CSS_SELECTOR, f"{detail_selectors[toggle_path]} > div.headerWrapper > span.header")
+            click_and_wait_for_pane_change(driver, toggle, selection_details_selector)
+            toggled = True
+    if toggled:
+        markup = snapshot_html(driver, selection_details_selector)
+        with metrics.phase('extract'):
+            record = parse_component_details(markup, detail_type)
+    return record
+
+def scrape_component(driver, i):
+    records = []
+    try:
+        # Update component details
+        safe_click(scroll_to_list_item(driver, components_list_selector, i, selection_details_selector))
+        wait_for_pane_change(driver)
+
+        # Scrape
+        selection_detail = driver.find_element(By.CSS_SELECTOR, f"{selection_details_selector} > div")
+        selection_detail_classes = selection_detail.get_attribute("class")
+
+        detail_type = next((name for name in COMPONENT_LIVE_SELECTORS if name in selection_detail_classes), None)
+        metrics.set_branch(detail_type)
+
+        if "epdDetails" in selection_detail_classes:
+            application_unit_selectors = driver.find_elements(By.CSS_SELECTOR, application_unit_selector)
+            if len(application_unit_selectors) == 1:
+                tabs = application_unit_selectors[0].find_elements(By.CSS_SELECTOR, "div.tab")[1:]
+                for tab in tabs:
+                    click_and_wait_for_pane_change(driver, tab, selection_details_selector)
+                    records.append(capture_component(driver, 'epdDetails'))
+            else:
+                records.append(capture_component(driver, 'epdDetails'))
+        elif "worksectionDetails" in selection_detail_classes:
+            records.append(capture_component(driver, 'worksectionDetails'))
+        elif "groupDetails" in selection_detail_classes:
+            tabs = selection_detail.find_elements(By.CSS_SELECTOR, f"div.variantSelector > div.tab")[1:]
+            for tab in tabs:
+                click_and_wait_for_pane_change(driver, tab, selection_details_selector)
+                records.append(capture_component(driver, 'groupDetails'))
+        else:
+            logging.error(selection_detail.get_attribute("outerHTML"))
+            raise ValueError(f"Unknown selection detail class: '{selection_detail_classes}'")
+    except Exception as e:
+        try:
+            component_name = "Unknown"
+            component_application = "Unknown"
 
-        for i in range(len(components)):
-            try:
-                # Re-fetch to avoid StaleElementReferenceException
-                components = driver.find_elements(By.CSS_SELECTOR, components_selector)
-                component = components[i]
-
-                # Update component details
-                safe_click(component)
-                scroll_to_element(components_list, component)
-
-                # Scrape
-                selection_detail = driver.find_element(By.CSS_SELECTOR, f"{selection_details_selector} > div")
-                selection_detail_classes = selection_detail.get_attribute("class")
-
-                if "epdDetails" in selection_detail_classes:
-                    application_unit_selectors = driver.find_elements(By.CSS_SELECTOR, application_unit_selector)
-                    if len(application_unit_selectors) == 1:
-                        tabs = application_unit_selectors[0].find_elements(By.CSS_SELECTOR, "div.tab")[1:]
-                        for tab in tabs:
-                            safe_click(tab)
-                            scrape_component(application_unit_type_selectors)
-                            counter += 1
-                    else:
-                        scrape_component(application_unit_type_selectors)
-                        counter += 1
-                elif "worksectionDetails" in selection_detail_classes:
-                    scrape_component(worksection_type_selectors)
-                    counter += 1
-                elif "groupDetails" in selection_detail_classes:
-                    tabs = selection_detail.find_elements(By.CSS_SELECTOR, f"div.variantSelector > div.tab")[1:]
-                    for tab in tabs:
-                        safe_click(tab)
-                        scrape_component(worksection_grouped_type_selectors)
-                        counter += 1
-                else:
-                    logging.error(selection_detail.get_attribute("outerHTML"))
-                    raise ValueError(f"Unknown selection detail class: '{selection_detail_classes}'")
-            except Exception as e:
+            for detail_type in ['epdDetails', 'worksectionDetails']:
                 try:
-                    component_name = "Unknown"
-                    component_application = "Unknown"
-
-                    detail_selectors = [application_unit_type_selectors, worksection_type_selectors]
-                    for detail_selector in detail_selectors:
-                        try:
-                            component_name = driver.find_element(By.CSS_SELECTOR, detail_selector['name']).text
-                            component_application = driver.find_element(By.CSS_SELECTOR, detail_selector['application']).text
-                            break
-                        except:
-                            pass
+                    component_name = driver.find_element(By.CSS_SELECTOR, COMPONENT_LIVE_SELECTORS[detail_type]['name']).text
+                    component_application = driver.find_element(By.CSS_SELECTOR, COMPONENT_LIVE_SELECTORS[detail_type]['application']).text
+                    break
                 except:
                     pass
-                logging.error(f"Error processing component '{component_name}' - '{component_application}': {e}")
-                traceback.print_exc()
-        
-    logging.info(f"Finished scraping {counter} components")
+        except:
+            pass
+        logging.error(f"Error processing component '{component_name}' - '{component_application}': {e}")
+        traceback.print_exc()
+        metrics.set_error(e)
+        return None
+    return records
+
+LIBRARIES = {
+    'elements': {
+        'path': "/user.library.xhtml?l=ELEMENTTYPE",
+        'base': elements_base_selector,
+        'ready': f"{element_details_selector} > {ELEMENT_SNAPSHOT_SELECTORS['name']}",
+        'list': elements_list_selector,
+        'items': elements_selector,
+        'pane': element_pane_selector,
+        'scrape_item': scrape_element,
+        'capture_rows': element_capture_rows,
+        'output': 'elements.csv',
+        'columns': ELEMENT_COLUMNS,
+        'key_columns': 1
+    },
+    'components': {
+        'path': "/user.library.xhtml?l=COMPONENT",
+        'base': components_base_selector,
+        'ready': f"{selection_details_selector} > div.epdDetails > div.applicationUnitDetails",
+        'list': components_list_selector,
+        'items': components_selector,
+        'pane': selection_details_selector,
+        'scrape_item': scrape_component,
+        'capture_rows': component_capture_rows,
+        'output': 'components.csv',
+        'columns': COMPONENT_COLUMNS,
+        'key_columns': 2
+    }
+}
+
+def library_url(kind):
+    # Resolved on use, so a run can be pointed at another server (e.g. replay.py) after import
+    return f"{BASE_URL}{LIBRARIES[kind]['path']}"
+
+def open_library(driver, kind):
+    library = LIBRARIES[kind]
+    driver.get(library_url(kind))
+    wait_for_element(driver, library['ready'])
+    return list_items(driver, library['items'])
+
+def list_item(label, attributes, images):
+    # The fingerprint covers what the list shows about an item, a change there marks the item as changed
+    parts = [label] + sorted(f"{name}={value}" for name, value in attributes if name.startswith('data-') or name == 'title') + images
+    return {'label': label, 'fingerprint': hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()}
+
+def list_items(driver, selector):
+    # All list labels and their list-level attributes in one round trip
+    entries = driver.execute_script("""
+        return Array.from(document.querySelectorAll(arguments[0]), item => [
+            item.textContent.trim().replace(/\\s+/g, ' '),
+            Array.from(item.attributes, attribute => [attribute.name, attribute.value]),
+            Array.from(item.querySelectorAll('img'), image => image.getAttribute('src') || '')
+        ]);
+    """, selector)
+    return [list_item(label, attributes, images) for label, attributes, images in entries]
+
+def split_range(total, parts):
+    # Contiguous shards whose sizes differ by at most one item
+    size, remainder = divmod(total, parts)
+    shards = []
+    start = 0
+    for part in range(parts):
+        end = start + size + (1 if part < remainder else 0)
+        shards.append((start, end))
+        start = end
+    return shards
+
+def split_indices(indices, parts):
+    return [indices[start:end] for start, end in split_range(len(indices), parts) if start < end]
+
+def recycle_session(sessions, worker, kind, browser):
+    # Replaces a degraded browser with a new one, logged in again unless the cached session is still valid
+    try:
+        sessions[worker].quit()
+    except Exception as e:
+        logging.warning(f"Could not close the degraded browser: {e}")
+    sessions[worker] = start_session(browser)
+    open_library(sessions[worker], kind)
+
+def scrape_shard(sessions, worker, kind, indices, results, recorder, browser=None):
+    # Sessions are only recycled when the browser options they were started with are known
+    library = LIBRARIES[kind]
+    restart = (lambda: recycle_session(sessions, worker, kind, browser)) if browser is not None else None
+    try:
+        open_library(sessions[worker], kind)
+        logging.info(f"Scraping {kind} {indices[0] + 1} to {indices[-1] + 1}")
+        run_with_retries(indices, lambda i: library['scrape_item'](sessions[worker], i), results, recorder, restart)
+    except Exception as e:
+        logging.error(f"Shard {indices[0] + 1} to {indices[-1] + 1} of {kind} stopped: {e}")
+        traceback.print_exc()
+    finally:
+        results.put(None)
+
+def write_as_captured(results, shard_count, write_item, ready=None):
+    # Items are written and journaled as they arrive from the shards, so an interrupted run keeps everything that was
+    # scraped; the output is put in list order once the run ends, see Journal.rewrite
+    for i, capture in (ready or {}).items():
+        write_item(i, capture)
+    finished = 0
+    while finished < shard_count:
+        result = results.get()
+        if result is None:
+            finished += 1
+            continue
+        write_item(*result)
+
+def compare_with_previous(output, kind, items, previous):
+    carried = {}
+    added = []
+    changed = []
+    for i, item in enumerate(items):
+        candidates = previous.get(item['label'], [])
+        if candidates:
+            entry = candidates.pop(0)
+            if entry.get('fingerprint') == item['fingerprint']:
+                carried[i] = entry
+            else:
+                changed.append(item['label'])
+        else:
+            added.append(item['label'])
+    # Whatever is left of the previous run did not match any current list item
+    removed = [{'label': label, 'keys': entry['keys']} for label, entries in previous.items() for entry in entries]
+
+    report = {'added': added, 'changed': changed, 'removed': removed, 'unchanged': len(carried)}
+    with open(f"{output}.changes.json", mode='w') as file:
+        json.dump(report, file, indent=2)
+    logging.info(f"Incremental {kind}: {len(added)} added, {len(changed)} changed, {len(removed)} removed, {len(carried)} unchanged")
+    return carried
+
+def collect_library(kind, items, run_shard, worker_count, fresh=False, incremental=False, store=None, parquet=False, output=None):
+    library = LIBRARIES[kind]
+    output = output or library['output']
+    journal = Journal(output)
+    previous = Journal(f"{output}.previous")
+    if incremental and journal.is_finished():
+        previous = journal.rotate()
+    done = journal.start(items, fresh)
+    if store is not None:
+        # The database follows the output: what the journal keeps of an interrupted run, or nothing
+        if done:
+            store.keep_items(kind, {entry['index']: i for i, entry in done.items()})
+        else:
+            store.clear(kind)
+    carried = compare_with_previous(output, kind, items, previous.items()) if incremental else {}
+    carried = {i: entry for i, entry in carried.items() if i not in done}
+    order = [i for i in range(len(items)) if i not in done]
+    pending = [i for i in order if i not in carried]
+
+    counts = {'rows': 0, 'items': 0, 'invalid': 0}
+    written = set()
+    recorder = metrics.Recorder(kind, output, items)
+    # UTF-8 whatever the locale, the journal's byte offsets and every reader of the output (carry-over, Parquet,
+    # store, query.py) assume it
+    with open(output, mode='a' if done else 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, delimiter=';')
+        if not done:
+            writer.writerow(library['columns'])
+            file.flush()
+            journal.begin(file.tell())
+
+        results = CaptureQueue(CAPTURE_QUEUE_SIZE)
+        batch = []
+
+        def flush_batch():
+            # The journal only points at rows that reached the output
+            file.flush()
+            if store is not None:
+                store.commit()
+            for i, keys, offset in batch:
+                journal.record(i, items[i], keys, offset)
+            journal.flush()
+            batch.clear()
+
+        def write_item(i, capture):
+            # Failed items are left out of the journal so a resumed run scrapes them again
+            if capture is None:
+                recorder.finish(i, 'failed')
+                return
+            write_start = time.perf_counter()
+            if i in carried:
+                # Unchanged items keep the rows of the previous run byte for byte
+                content = carried[i]['content'].decode('utf-8')
+                file.write(content)
+                keys = carried[i]['keys']
+                counts['rows'] += len(capture)
+                if store is not None:
+                    store.add_item(kind, i, list(csv.reader(io.StringIO(content, newline=''), delimiter=';')))
+            else:
+                try:
+                    rows = validate_rows(library['capture_rows'](capture), library['columns'], library['key_columns'])
+                except Exception as e:
+                    logging.error(f"Could not parse {kind} item {i + 1} '{items[i]['label']}': {e}")
+                    traceback.print_exc()
+                    counts['invalid'] += 1
+                    recorder.finish(i, 'invalid', 0, time.perf_counter() - write_start)
+                    return
+                writer.writerows(rows)
+                if store is not None:
+                    store.add_item(kind, i, rows)
+                keys = sorted({tuple(row[:library['key_columns']]) for row in rows})
+                counts['rows'] += len(rows)
+                counts['items'] += 1
+                recorder.finish(i, 'ok', len(rows), time.perf_counter() - write_start)
+            written.add(i)
+            batch.append((i, keys, file.tell()))
+            if len(batch) >= WRITE_BATCH_SIZE or results.empty():
+                flush_batch()
+
+        shards = split_indices(pending, worker_count)
+        ready = {i: entry['content'].decode('utf-8').splitlines() for i, entry in carried.items()}
+        with ThreadPoolExecutor(max_workers=max(len(shards), 1)) as executor:
+            for worker, indices in enumerate(shards):
+                executor.submit(run_shard, worker, indices, results, recorder)
+            try:
+                write_as_captured(results, len(shards), write_item, ready)
+            finally:
+                # Also on Ctrl-C or a failing write, otherwise the shards block on the full queue and the join hangs
+                results.stop()
+        flush_batch()
+
+    journal.rewrite()
+    if parquet:
+        # Mirrors the CSV, including the rows a resumed run kept
+        columnar.convert(output)
+    write_failures(output, items, [i for i in order if i not in written], recorder)
+    if len(done) + len(written) < len(items):
+        journal.close()
+        logging.warning(f"{len(items) - len(done) - len(written)} {kind} not scraped, run again to resume")
+    else:
+        journal.finish()
+    if counts['invalid']:
+        logging.warning(f"{counts['invalid']} {kind} could not be parsed")
+    logging.info(f"Finished scraping {kind}: {counts['items']} items scraped, {len(carried)} carried over, {counts['rows']} rows")
+    return recorder.summary()
+
+def scrape_library(kind, sessions, fresh=False, incremental=False, store=None, parquet=False, browser=None):
+    library = LIBRARIES[kind]
+    logging.info(f"Scraping {kind}...")
+
+    items = open_library(sessions[0], kind)
+    logging.info(sessions[0].find_element(By.CSS_SELECTOR, f"{library['base']} > div.filterAndList > div.listArea > div.listAreaTitle > span.totalSize").text)
+    logging.info(f"Elements in list: {len(items)}")
+
+    return collect_library(kind, items, lambda worker, indices, results, recorder: scrape_shard(sessions, worker, kind, indices, results, recorder, browser), len(sessions), fresh, incremental, store, parquet)
 
 def main():
+    parser = argparse.ArgumentParser(description="Scrape the TOTEM element and component libraries")
+    parser.add_argument('--workers', type=int, default=1, help="number of browser sessions scraping in parallel")
+    parser.add_argument('--fresh', action='store_true', help="ignore the progress journal of an interrupted run and start over")
+    parser.add_argument('--incremental', action='store_true', help="only scrape items that are new or changed since the last finished run")
+    parser.add_argument('--sqlite', help="also write the scraped rows to this SQLite database, see store.py")
+    parser.add_argument('--parquet', action='store_true', help="also write elements.parquet / components.parquet with typed columns")
+    add_browser_arguments(parser)
+    args = parser.parse_args()
+    browser = browser_options(args)
+
+    sessions = []
+    store = open_store(args)
     try:
-        login()
-        scrape_elements()
-        scrape_components()
+        sessions = start_sessions(browser, args.workers)
+        scrape_library('elements', sessions, args.fresh, args.incremental, store, args.parquet, browser)
+        scrape_library('components', sessions, args.fresh, args.incremental, store, args.parquet, browser)
     except Exception as e:
         logging.error(f"Fatal error occurred: {e}")
         traceback.print_exc()
     finally:
-        logging.info("Closing the driver")
-        driver.quit()
+        logging.info("Closing the drivers")
+        for driver in sessions:
+            driver.quit()
+        if store is not None:
+            store.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
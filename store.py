@@ -0,0 +1,244 @@
+import os
+import csv
+import sqlite3
+import logging
+
+SEP = ';'
+
+# One row per element and per layer or sublayer, one row per component, per application unit (a tab or variant of a
+# component with its own properties) and per end-of-life material. list_index is the position of the item in the
+# library list, or in the CSV the tables were loaded from.
+SCHEMA = """
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS elements (
+    id INTEGER PRIMARY KEY,
+    list_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    u_value REAL
+);
+CREATE TABLE IF NOT EXISTS layers (
+    id INTEGER PRIMARY KEY,
+    element_id INTEGER NOT NULL REFERENCES elements(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    layer TEXT,
+    composition TEXT,
+    ratio REAL,
+    component_name TEXT,
+    application TEXT,
+    lifetime REAL,
+    thickness REAL
+);
+CREATE TABLE IF NOT EXISTS components (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS application_units (
+    id INTEGER PRIMARY KEY,
+    component_id INTEGER NOT NULL REFERENCES components(id) ON DELETE CASCADE,
+    list_index INTEGER NOT NULL,
+    application TEXT,
+    category TEXT,
+    type TEXT,
+    database TEXT,
+    lci_id TEXT,
+    lambda REAL,
+    r_value REAL,
+    u_value REAL,
+    min_density REAL,
+    max_density REAL,
+    functional_unit TEXT,
+    type_of_assembly TEXT
+);
+CREATE TABLE IF NOT EXISTS materials (
+    id INTEGER PRIMARY KEY,
+    application_unit_id INTEGER NOT NULL REFERENCES application_units(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    material TEXT,
+    waste_category TEXT,
+    landfill REAL,
+    incineration REAL,
+    reuse REAL,
+    recycling REAL,
+    sorted_on_building_site REAL
+);
+
+CREATE INDEX IF NOT EXISTS elements_name ON elements(name);
+CREATE INDEX IF NOT EXISTS elements_list_index ON elements(list_index);
+CREATE INDEX IF NOT EXISTS layers_element ON layers(element_id, position);
+CREATE INDEX IF NOT EXISTS layers_component ON layers(component_name, application);
+CREATE INDEX IF NOT EXISTS layers_application ON layers(application);
+CREATE INDEX IF NOT EXISTS application_units_component ON application_units(component_id, application);
+CREATE INDEX IF NOT EXISTS application_units_application ON application_units(application);
+CREATE INDEX IF NOT EXISTS application_units_lci_id ON application_units(lci_id);
+CREATE INDEX IF NOT EXISTS application_units_list_index ON application_units(list_index);
+CREATE INDEX IF NOT EXISTS materials_application_unit ON materials(application_unit_id, position);
+CREATE INDEX IF NOT EXISTS materials_material ON materials(material);
+
+-- The rows and columns of totem_data.csv, element layers without a component with materials keep empty component columns
+CREATE VIEW IF NOT EXISTS totem_data AS
+SELECT
+    e.name AS "Element Name", e.u_value AS "Element U-Value", l.layer AS "Layer", l.composition AS "Composition",
+    l.ratio AS "Ratio", l.component_name AS "Component Name", l.application AS "Application", l.lifetime AS "Lifetime",
+    l.thickness AS "Thickness", u.category AS "Category", u.type AS "Type", u.database AS "Database",
+    u.lci_id AS "LCI-ID", u.lambda AS "Lambda", u.r_value AS "R-Value", u.u_value AS "U-Value",
+    u.min_density AS "Min Density", u.max_density AS "Max Density", u.functional_unit AS "Functional Unit",
+    u.type_of_assembly AS "Type of Assembly", m.material AS "Material", m.waste_category AS "Waste Category",
+    m.landfill AS "Landfill", m.incineration AS "Incineration", m.reuse AS "Reuse", m.recycling AS "Recycling",
+    m.sorted_on_building_site AS "Sorted on Building Site"
+FROM layers l
+JOIN elements e ON e.id = l.element_id
+LEFT JOIN components c ON c.name = l.component_name
+LEFT JOIN application_units u ON u.component_id = c.id AND u.application = l.application
+    AND EXISTS (SELECT 1 FROM materials WHERE application_unit_id = u.id)
+LEFT JOIN materials m ON m.application_unit_id = u.id
+ORDER BY e.list_index, e.id, l.position, u.list_index, u.id, m.position;
+"""
+
+UNIT_COLUMNS = ['application', 'category', 'type', 'database', 'lci_id', 'lambda', 'r_value', 'u_value',
+                'min_density', 'max_density', 'functional_unit', 'type_of_assembly']
+MATERIAL_COLUMNS = ['material', 'waste_category', 'landfill', 'incineration', 'reuse', 'recycling', 'sorted_on_building_site']
+LAYER_COLUMNS = ['layer', 'composition', 'ratio', 'component_name', 'application', 'lifetime', 'thickness']
+
+# Columns of the scraped rows holding numbers; the scraper hands them over as numbers, a CSV as strings
+NUMBER_COLUMNS = {'Element U-Value', 'Ratio', 'Lifetime', 'Thickness', 'Lambda', 'R-Value', 'U-Value', 'Min Density',
+                  'Max Density', 'Landfill', 'Incineration', 'Reuse', 'Recycling', 'Sorted on Building Site'}
+# First column of a component row that describes one of its materials instead of the application unit
+FIRST_MATERIAL_COLUMN = 'Material'
+
+def number(value):
+    # The one parser of the number columns, shared by the SQLite store, the Parquet files and query.py. Anything that
+    # is not a number, e.g. 'Not available' in Sorted on Building Site, counts as missing.
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def typed_row(row, columns):
+    return [number(value) if column in NUMBER_COLUMNS else (None if value == '' else value) for column, value in zip(columns, row)]
+
+# Writes the rows of scraped list items, as produced for elements.csv and components.csv, to the normalized tables.
+# columns maps each library kind to the columns of its rows.
+class Store:
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.component_ids = {}
+
+    def clear(self, kind):
+        if kind == 'elements':
+            self.connection.execute("DELETE FROM elements")
+        else:
+            self.connection.execute("DELETE FROM components")
+            self.component_ids.clear()
+        self.commit()
+
+    def keep_items(self, kind, moves):
+        # A resumed run keeps the items its journal lists, anything written after the journal's last entry is dropped.
+        # moves maps the list index an item was written with to its index in the current list, which differs for
+        # items the journal matched by label after the list changed.
+        table = 'elements' if kind == 'elements' else 'application_units'
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS kept_items (list_index INTEGER PRIMARY KEY, new_index INTEGER NOT NULL)")
+        self.connection.execute("DELETE FROM kept_items")
+        self.connection.executemany("INSERT INTO kept_items VALUES (?, ?)", moves.items())
+        self.connection.execute(f"DELETE FROM {table} WHERE list_index NOT IN (SELECT list_index FROM kept_items)")
+        self.connection.execute(f"UPDATE {table} SET list_index = (SELECT new_index FROM kept_items WHERE kept_items.list_index = {table}.list_index)")
+        if kind == 'components':
+            self.connection.execute("DELETE FROM components WHERE id NOT IN (SELECT component_id FROM application_units)")
+            self.component_ids.clear()
+        self.commit()
+
+    def add_item(self, kind, index, rows):
+        rows = [typed_row(row, self.columns[kind]) for row in rows]
+        if kind == 'elements':
+            self.add_element(index, rows)
+        else:
+            self.add_component(index, rows, self.columns[kind].index(FIRST_MATERIAL_COLUMN))
+
+    def add_element(self, index, rows):
+        if not rows:
+            return
+        element_id = self.connection.execute(
+            "INSERT INTO elements (list_index, name, u_value) VALUES (?, ?, ?)", (index, rows[0][0], rows[0][1])
+        ).lastrowid
+        self.connection.executemany(
+            f"INSERT INTO layers (element_id, position, {', '.join(LAYER_COLUMNS)}) VALUES (?, ?, {', '.join('?' * len(LAYER_COLUMNS))})",
+            [(element_id, position, *row[2:]) for position, row in enumerate(rows)]
+        )
+
+    def component_id(self, name):
+        if name not in self.component_ids:
+            self.connection.execute("INSERT OR IGNORE INTO components (name) VALUES (?)", (name,))
+            self.component_ids[name] = self.connection.execute("SELECT id FROM components WHERE name = ?", (name,)).fetchone()[0]
+        return self.component_ids[name]
+
+    def add_component(self, index, rows, unit_fields):
+        # Consecutive rows with the same component and unit values are the materials of one application unit
+        unit_id = None
+        unit = None
+        position = 0
+        for row in rows:
+            if row[:unit_fields] != unit:
+                unit = row[:unit_fields]
+                unit_id = self.connection.execute(
+                    f"INSERT INTO application_units (component_id, list_index, {', '.join(UNIT_COLUMNS)}) VALUES (?, ?, {', '.join('?' * len(UNIT_COLUMNS))})",
+                    (self.component_id(unit[0]), index, *unit[1:])
+                ).lastrowid
+                position = 0
+            self.connection.execute(
+                f"INSERT INTO materials (application_unit_id, position, {', '.join(MATERIAL_COLUMNS)}) VALUES (?, ?, {', '.join('?' * len(MATERIAL_COLUMNS))})",
+                (unit_id, position, *row[unit_fields:])
+            )
+            position += 1
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+def csv_columns(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return next(csv.reader(file, delimiter=SEP), [])
+
+# Leading columns that stay the same over the rows of one list item in a scraped CSV. Two elements can share a name.
+ITEM_KEY_COLUMNS = {
+    'elements': 2,
+    'components': 1
+}
+
+def csv_items(path, key_columns):
+    # The rows of a scraped CSV grouped per list item, i.e. per run of rows with the same name
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file, delimiter=SEP)
+        next(reader, None)
+        item = []
+        for row in reader:
+            if item and row[:key_columns] != item[0][:key_columns]:
+                yield item
+                item = []
+            item.append(row)
+        if item:
+            yield item
+
+def load_csv(store, kind, path):
+    store.clear(kind)
+    for index, rows in enumerate(csv_items(path, ITEM_KEY_COLUMNS[kind])):
+        store.add_item(kind, index, rows)
+    store.commit()
+
+def build(path, elements_path='elements.csv', components_path='components.csv'):
+    store = Store(path, {'elements': csv_columns(elements_path), 'components': csv_columns(components_path)})
+    try:
+        load_csv(store, 'elements', elements_path)
+        load_csv(store, 'components', components_path)
+        store.connection.execute("ANALYZE")
+        counts = {table: store.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ('elements', 'components', 'application_units')}
+    finally:
+        store.close()
+    logging.info(f"Wrote {counts['elements']} elements, {counts['components']} components and {counts['application_units']} application units to {os.path.abspath(path)}")
@@ -0,0 +1,178 @@
+import os
+import csv
+import logging
+import argparse
+import traceback
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+import scrape
+import metrics
+from journal import Journal
+from scheduler import run_with_retries
+from scrape import (LIBRARIES, WAIT_TIMEOUT, ARM_PANE_OBSERVER, PANE_QUIET_MS, components_search_selector,
+                    components_list_selector, components_selector)
+
+SEP = ';'
+MISSING_PATH = 'element_components_missing.csv'
+# Targeted runs keep their own output and journal, components.csv may hold the full library or a run of scrape.py
+TARGETED_OUTPUT = 'components.targeted.csv'
+MISSING_OUTPUT = 'components.missing.csv'
+
+# Types into the library's search box in one go, so the list is filtered once, and arms the observer for the list
+SEARCH = ARM_PANE_OBSERVER + """
+    const input = document.querySelector(arguments[0]);
+    if (!input) {
+        throw new Error('Search box of the component library not found');
+    }
+    armPaneObserver(arguments[2], arguments[3]);
+    input.focus();
+    input.value = arguments[1];
+    for (const type of ['input', 'change']) {
+        input.dispatchEvent(new Event(type, {bubbles: true}));
+    }
+    input.dispatchEvent(new KeyboardEvent('keyup', {bubbles: true, key: 'Enter'}));
+"""
+# Position of the list item showing exactly the name, as its whole label or as one of its parts. Names often share a
+# prefix, so a partial match could be another component. Shifted by one so that not found is falsy.
+FIND_LIST_ITEM = """
+    const clean = text => text.trim().replace(/\\s+/g, ' ');
+    return Array.from(document.querySelectorAll(arguments[0])).findIndex(item => clean(item.textContent) === arguments[1]
+        || Array.from(item.querySelectorAll('*'), node => clean(node.textContent)).includes(arguments[1])) + 1;
+"""
+
+def read_element_names(path):
+    with open(path, encoding='utf-8') as file:
+        return {line.strip() for line in file if line.strip()}
+
+def read_keys(path, element_names=None):
+    # (Component Name, Application) pairs in order of first use, of the given elements only if names are given
+    keys = {}
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file, delimiter=SEP):
+            if element_names is not None and row.get('Element Name') not in element_names:
+                continue
+            if row['Component Name']:
+                keys[(row['Component Name'], row['Application'])] = None
+    return list(keys)
+
+def target_items(keys):
+    # One target per component, its list item holds all of its applications
+    return [scrape.list_item(name, [], []) for name in dict.fromkeys(name for name, _ in keys)]
+
+def search_component(driver, name):
+    with metrics.phase('click'):
+        driver.execute_script(SEARCH, components_search_selector, name, components_list_selector, PANE_QUIET_MS)
+    try:
+        scrape.wait_for_pane_change(driver)
+    except TimeoutException:
+        # A retry searches for the same name again, the filtered list then stays as it is
+        pass
+    try:
+        with metrics.phase('wait'):
+            return WebDriverWait(driver, WAIT_TIMEOUT).until(lambda driver: driver.execute_script(FIND_LIST_ITEM, components_selector, name)) - 1
+    except TimeoutException:
+        return None
+
+def scrape_target(driver, name):
+    position = search_component(driver, name)
+    if position is None:
+        raise LookupError(f"Component '{name}' not found in the library")
+    records = scrape.scrape_component(driver, position)
+    # The item is only written if the pane showed the component that was searched for
+    for record in records or []:
+        if record['name'] != name:
+            raise LookupError(f"Search for '{name}' opened '{record['name']}'")
+    return records
+
+def scrape_targets(sessions, worker, items, indices, results, recorder, browser):
+    try:
+        scrape.open_library(sessions[worker], 'components')
+        logging.info(f"Searching components {indices[0] + 1} to {indices[-1] + 1} of {len(items)}")
+        run_with_retries(indices, lambda i: scrape_target(sessions[worker], items[i]['label']), results, recorder,
+                         lambda: scrape.recycle_session(sessions, worker, 'components', browser))
+    except Exception as e:
+        logging.error(f"Targets {indices[0] + 1} to {indices[-1] + 1} stopped: {e}")
+        traceback.print_exc()
+    finally:
+        results.put(None)
+
+def scrape_components(sessions, keys, output, browser, fresh=False):
+    items = target_items(keys)
+    logging.info(f"Scraping {len(items)} components for {len(keys)} (Component Name, Application) pairs into {output}")
+    return scrape.collect_library('components', items, lambda worker, indices, results, recorder: scrape_targets(sessions, worker, items, indices, results, recorder, browser),
+                                  len(sessions), fresh, output=output)
+
+def output_keys(path):
+    if not os.path.isfile(path):
+        return set()
+    return set(read_keys(path))
+
+def append_new_rows(source, output):
+    # Rows of components the output does not have yet, all rows of a component that is already there are skipped
+    existing = output_keys(output)
+    appended = 0
+    write_header = not os.path.isfile(output)
+    with open(source, newline='', encoding='utf-8') as source_file, open(output, mode='a', newline='', encoding='utf-8') as output_file:
+        reader = csv.reader(source_file, delimiter=SEP)
+        writer = csv.writer(output_file, delimiter=SEP)
+        header = next(reader)
+        if write_header:
+            writer.writerow(header)
+        for row in reader:
+            if (row[0], row[1]) not in existing:
+                writer.writerow(row)
+                appended += 1
+    return appended
+
+def add_to_components(source, components):
+    # An interrupted scrape.py run resumes from the journal of components.csv, rows appended behind its back would be cut
+    # off again or break its offsets
+    journal = Journal(components)
+    if journal.load()[0] is not None and not journal.is_finished():
+        logging.warning(f"{components} is from an interrupted scrape.py run, the components found stay in {source}")
+        return
+    logging.info(f"Added {append_new_rows(source, components)} rows from {source} to {components}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape only the components the elements use, by searching for them in the component library")
+    parser.add_argument('--elements', default=LIBRARIES['elements']['output'], help="CSV in the format of elements.csv to take the components from, e.g. a project's element set")
+    parser.add_argument('--element-names', help="file with one element name per line, only the components of these elements are scraped")
+    parser.add_argument('--missing', action='store_true', help=f"retry the components listed in {MISSING_PATH}, scraped into {MISSING_OUTPUT}")
+    parser.add_argument('--output', default=TARGETED_OUTPUT, help="CSV the targeted run writes, with its own progress journal")
+    parser.add_argument('--components', default=LIBRARIES['components']['output'], help="CSV merge.py reads, the components found are added to it unless it already has them")
+    parser.add_argument('--workers', type=int, default=1, help="number of browser sessions searching in parallel")
+    parser.add_argument('--fresh', action='store_true', help="ignore the progress journal of an interrupted run and start over")
+    scrape.add_browser_arguments(parser)
+    args = parser.parse_args()
+
+    element_names = read_element_names(args.element_names) if args.element_names else None
+    keys = read_keys(MISSING_PATH if args.missing else args.elements, element_names)
+    if not keys:
+        logging.info("No components to scrape")
+        return
+
+    sessions = []
+    try:
+        browser = scrape.browser_options(args)
+        sessions = scrape.start_sessions(browser, args.workers)
+        output = MISSING_OUTPUT if args.missing else args.output
+        scrape_components(sessions, keys, output, browser, args.fresh)
+        add_to_components(output, args.components)
+
+        found = output_keys(args.components) | output_keys(output)
+        still_missing = [key for key in keys if key not in found]
+        for name, application in still_missing:
+            logging.warning(f"Still missing: '{name}' - '{application}'")
+        logging.info(f"{len(keys) - len(still_missing)} of {len(keys)} components found, run merge.py to update totem_data.csv")
+    except Exception as e:
+        logging.error(f"Fatal error occurred: {e}")
+        traceback.print_exc()
+    finally:
+        logging.info("Closing the drivers")
+        for driver in sessions:
+            driver.quit()
+
+if __name__ == '__main__':
+    main()
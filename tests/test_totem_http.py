@@ -0,0 +1,79 @@
+import os
+import csv
+import threading
+
+import pytest
+
+import scrape
+import replay
+import totem_http
+
+# Hand-written library pages and partial responses in the layout `totem_http.py --record` writes
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'http')
+
+@pytest.fixture
+def replay_server(monkeypatch, tmp_path):
+    server = replay.serve(FIXTURES, 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(scrape, 'BASE_URL', f"http://127.0.0.1:{server.server_port}")
+    # Outputs, journals and metrics are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return list(csv.reader(file, delimiter=';'))
+
+@pytest.mark.parametrize('onclick, behavior', [
+    ("mojarra.ab(this,event,'click','@this','details')", {'event': 'click', 'execute': '@this', 'render': 'details'}),
+    ("jsf.ajax.request(this,event,{execute:'@this',render:'details'})", {'event': 'click', 'execute': '@this', 'render': 'details'}),
+    ('PrimeFaces.ab({s:"item",e:"click",p:"item",u:"details"})', {'event': 'click', 'execute': 'item', 'render': 'details'}),
+    ("location.href='/'", None)
+])
+def test_parse_ajax_behavior(onclick, behavior):
+    assert totem_http.parse_ajax_behavior(onclick) == behavior
+
+def test_partial_response_updates_the_document(replay_server):
+    library = totem_http.HttpLibrary(totem_http.create_session([]), 'elements')
+    assert library.open() == 2
+    library.click(library.items()[1], is_item=True)
+
+    assert library.select("input[name='javax.faces.ViewState']")[0].get('value') == 'view-3'
+    record = scrape.parse_element_details(library.snapshot(scrape.element_details_selector))
+    assert record['name'] == 'Brick wall'
+    assert [part['name'] for layer in record['layers'] for part in layer['parts']] == ['Clay brick']
+
+def test_partial_response_error():
+    library = totem_http.HttpLibrary(None, 'elements')
+    with pytest.raises(RuntimeError, match='View expired'):
+        library.apply_partial_response(b"<partial-response><error><error-name>ViewExpiredException</error-name>"
+                                       b"<error-message>View expired</error-message></error></partial-response>")
+
+def test_scrape_elements(replay_server):
+    summary = totem_http.scrape_library('elements', [], fresh=True)
+
+    assert summary['items'] == 2 and summary['failed'] == 0
+    assert read_rows('elements.csv') == [
+        scrape.ELEMENT_COLUMNS,
+        ['Timber frame wall', '0.18', 'C1', 'a', '1', 'Gypsum board', 'Wall finish | Interior', '30', '0.0125'],
+        ['Timber frame wall', '0.18', 'C2', 'a', '0.85', 'Mineral wool', 'Insulation | Wall', '60', '0.14'],
+        ['Timber frame wall', '0.18', 'C2', 'b', '0.15', 'Timber stud', 'Structure | Wall', '60', '0.14'],
+        ['Brick wall', '', 'C1', 'a', '1', 'Clay brick', 'Outer leaf | Wall', '90', '0.09']
+    ]
+
+def test_scrape_components(replay_server):
+    summary = totem_http.scrape_library('components', [], workers=2, fresh=True)
+
+    assert summary['items'] == 2 and summary['failed'] == 0
+    rows = read_rows('components.csv')
+    assert rows[0] == scrape.COMPONENT_COLUMNS
+    assert rows[1:] == [
+        ['Gypsum board', 'Wall finish | Interior', 'Board', 'Generic component', 'Ecoinvent 3.6', 'WS100', '0.25', '', '',
+         '', '', 'sqm', 'Screwed', 'Gypsum', 'Mineral waste', '0.6', '0.0', '0.0', '0.4', 'Not available'],
+        ['Mineral wool', 'Insulation | Wall', 'Insulation', 'Specific component (EPD)', 'Ecoinvent 3.6', 'EPD200-1', '0.035', '', '',
+         '30', '50', 'sqm', 'Clamped', 'Mineral wool', 'Mineral insulation materials', '0.8', '0.0', '0.0', '0.2', '1.0'],
+        ['Mineral wool', 'Insulation | Pitched roof', 'Insulation', 'Specific component (EPD)', 'Ecoinvent 3.6', 'EPD200-2', '0.035', '', '',
+         '70', '70', 'sqm', 'Clamped', 'Mineral wool', 'Mineral insulation materials', '0.9', '0.0', '0.0', '0.1', '1.0']
+    ]
@@ -0,0 +1,307 @@
+import os
+import re
+import json
+import logging
+import argparse
+import traceback
+from urllib.parse import urljoin
+
+import lxml.html
+import lxml.etree
+import requests
+from requests.adapters import HTTPAdapter
+
+import scrape
+import metrics
+from scheduler import run_with_retries
+from scrape import (LIBRARIES, COMPONENT_LIVE_SELECTORS, element_details_selector, selection_details_selector,
+                    application_unit_selector, node_text, list_item, parse_component_details)
+
+# Inline JSF/PrimeFaces ajax behaviors, e.g. mojarra.ab(this,event,'click','@this','details') or PrimeFaces.ab({s:"id",u:"details"})
+MOJARRA_BEHAVIOR = re.compile(r"mojarra\.ab\(\s*[^,]+,\s*[^,]+,\s*'([^']*)'\s*,\s*'([^']*)'\s*,\s*'([^']*)'")
+JSF_AJAX_BEHAVIOR = re.compile(r"(?:jsf|faces)\.ajax\.request\(.*?\{(.*?)\}")
+PRIMEFACES_BEHAVIOR = re.compile(r"PrimeFaces\.ab\(\{(.*?)\}\)")
+BEHAVIOR_OPTION = re.compile(r"""['"]?(\w+)['"]?\s*:\s*['"]([^'"]*)['"]""")
+
+VIEW_STATE_NAMES = ('javax.faces.ViewState', 'jakarta.faces.ViewState')
+
+class UnsupportedPageError(Exception):
+    pass
+
+def create_session(cookies, pool_size=1):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+    return session
+
+def parse_ajax_behavior(onclick):
+    if not onclick:
+        return None
+    match = MOJARRA_BEHAVIOR.search(onclick)
+    if match:
+        return {'event': match.group(1), 'execute': match.group(2), 'render': match.group(3)}
+    match = JSF_AJAX_BEHAVIOR.search(onclick)
+    if match:
+        options = dict(BEHAVIOR_OPTION.findall(match.group(1)))
+        return {'event': 'click', 'execute': options.get('execute', '@this'), 'render': options.get('render', '@all')}
+    match = PRIMEFACES_BEHAVIOR.search(onclick)
+    if match:
+        options = dict(BEHAVIOR_OPTION.findall(match.group(1)))
+        return {'event': options.get('e', 'click'), 'execute': options.get('p', '@this'), 'render': options.get('u', '@all')}
+    return None
+
+def file_name_for(client_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", client_id)
+
+# Replays the selection requests of one library page and keeps a local copy of its DOM up to date
+class HttpLibrary:
+    def __init__(self, session, kind, record_dir=None):
+        self.session = session
+        self.kind = kind
+        self.url = scrape.library_url(kind)
+        self.document = None
+        self.record_dir = os.path.join(record_dir, kind) if record_dir else None
+        self.selected_item = None
+
+    def open(self):
+        response = self.session.get(self.url)
+        response.raise_for_status()
+        self.document = lxml.html.fromstring(response.content, base_url=response.url)
+        self.record('page.html', response.content)
+
+        items = self.items()
+        if not items:
+            raise UnsupportedPageError(f"No {self.kind} found in the server rendered page")
+        if parse_ajax_behavior(items[0].get('onclick')) is None or not items[0].get('id'):
+            raise UnsupportedPageError(f"List items of {self.kind} carry no replayable ajax behavior")
+        return len(items)
+
+    def items(self):
+        return self.document.cssselect(LIBRARIES[self.kind]['items'])
+
+    def list_items(self):
+        return [list_item(node_text(item), item.attrib.items(), [image.get('src', '') for image in item.iter('img')]) for item in self.items()]
+
+    def select(self, selector):
+        return self.document.cssselect(selector)
+
+    def snapshot(self, selector):
+        with metrics.phase('extract'):
+            nodes = self.document.cssselect(selector)
+            return lxml.html.tostring(nodes[0], encoding='unicode') if nodes else None
+
+    def click(self, node, is_item=False):
+        behavior = parse_ajax_behavior(node.get('onclick'))
+        source = node.get('id')
+        if behavior is None or not source:
+            raise UnsupportedPageError(f"Element '{source}' carries no replayable ajax behavior")
+        forms = list(node.iterancestors('form'))
+        if not forms:
+            raise UnsupportedPageError(f"Element '{source}' is not inside a form")
+        form = forms[0]
+
+        payload = form.form_values() + [
+            ('javax.faces.partial.ajax', 'true'),
+            ('javax.faces.source', source),
+            ('javax.faces.partial.execute', source if behavior['execute'] == '@this' else behavior['execute']),
+            ('javax.faces.partial.render', behavior['render']),
+            ('javax.faces.behavior.event', behavior['event']),
+            ('javax.faces.partial.event', behavior['event'])
+        ]
+        with metrics.phase('click'):
+            response = self.session.post(
+                urljoin(self.url, form.get('action') or self.url),
+                data=payload,
+                headers={'Faces-Request': 'partial/ajax', 'X-Requested-With': 'XMLHttpRequest'}
+            )
+            response.raise_for_status()
+        metrics.count('commands')
+
+        if is_item:
+            self.selected_item = source
+            self.record(f"{file_name_for(source)}.xml", response.content)
+        else:
+            self.record(os.path.join(file_name_for(self.selected_item or 'page'), f"{file_name_for(source)}.xml"), response.content)
+        with metrics.phase('extract'):
+            self.apply_partial_response(response.content)
+
+    def apply_partial_response(self, content):
+        root = lxml.etree.fromstring(content)
+        for error in root.iter('error'):
+            raise RuntimeError(f"Partial response error: {error.findtext('error-message')}")
+        for redirect in root.iter('redirect'):
+            raise RuntimeError(f"Session expired, redirected to {redirect.get('url')}")
+
+        for update in root.iter('update'):
+            target_id = update.get('id')
+            markup = update.text or ''
+            if any(name in target_id for name in VIEW_STATE_NAMES):
+                for name in VIEW_STATE_NAMES:
+                    for view_state in self.document.xpath(f"//input[@name='{name}']"):
+                        view_state.set('value', markup)
+            elif target_id in ('javax.faces.ViewRoot', 'jakarta.faces.ViewRoot'):
+                self.document = lxml.html.fromstring(markup, base_url=self.url)
+            else:
+                current = self.document.get_element_by_id(target_id, None)
+                if current is None:
+                    logging.warning(f"Partial response updates unknown element '{target_id}'")
+                    continue
+                current.getparent().replace(current, lxml.html.fragment_fromstring(markup))
+
+    def record(self, name, content):
+        if not self.record_dir:
+            return
+        path = os.path.join(self.record_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode='wb') as file:
+            file.write(content)
+
+def scrape_element(library, i):
+    try:
+        metrics.set_branch('etLibraryObject')
+        library.click(library.items()[i], is_item=True)
+        return library.snapshot(element_details_selector)
+    except Exception as e:
+        logging.error(f"Error processing element at {i + 1}: {e}")
+        traceback.print_exc()
+        metrics.set_error(e)
+        return None
+
+def capture_component(library, detail_type):
+    detail_selectors = COMPONENT_LIVE_SELECTORS[detail_type]
+    record = parse_component_details(library.snapshot(selection_details_selector), detail_type)
+
+    # Panels that are collapsed server side are only opened when their header replays a request
+    toggled = False
+    for has_panel, is_open, toggle_path in [
+        ('has_reversibility', 'is_reversibility_open', 'reversibility_toggle_path'),
+        ('has_end_of_life', 'is_end_of_life_open', 'end_of_life_toggle_path')
+    ]:
+        headers = library.select(f"{detail_selectors[toggle_path]} > div.headerWrapper > span.header")
+        if record[has_panel] and not record[is_open] and headers and parse_ajax_behavior(headers[0].get('onclick')):
+            library.click(headers[0])
+            toggled = True
+    if toggled:
+        record = parse_component_details(library.snapshot(selection_details_selector), detail_type)
+    return record
+
+def scrape_component(library, i):
+    records = []
+    try:
+        library.click(library.items()[i], is_item=True)
+
+        selection_detail = library.select(f"{selection_details_selector} > div")[0]
+        selection_detail_classes = selection_detail.get("class", "")
+        metrics.set_branch(next((name for name in COMPONENT_LIVE_SELECTORS if name in selection_detail_classes), None))
+
+        if "epdDetails" in selection_detail_classes:
+            tab_count = len(library.select(f"{application_unit_selector} div.tab")[1:])
+            if tab_count:
+                for t in range(tab_count):
+                    library.click(library.select(f"{application_unit_selector} div.tab")[t + 1])
+                    records.append(capture_component(library, 'epdDetails'))
+            else:
+                records.append(capture_component(library, 'epdDetails'))
+        elif "worksectionDetails" in selection_detail_classes:
+            records.append(capture_component(library, 'worksectionDetails'))
+        elif "groupDetails" in selection_detail_classes:
+            tabs_selector = f"{selection_details_selector} > div.groupDetails div.variantSelector > div.tab"
+            for t in range(len(library.select(tabs_selector)[1:])):
+                library.click(library.select(tabs_selector)[t + 1])
+                records.append(capture_component(library, 'groupDetails'))
+        else:
+            raise ValueError(f"Unknown selection detail class: '{selection_detail_classes}'")
+    except Exception as e:
+        logging.error(f"Error processing component at {i + 1}: {e}")
+        traceback.print_exc()
+        metrics.set_error(e)
+        return None
+    return records
+
+HTTP_SCRAPE_ITEM = {
+    'elements': scrape_element,
+    'components': scrape_component
+}
+
+def recycle_library(libraries, worker, cookies, record_dir):
+    # A new session and page, and so a new view state, for a worker whose requests keep failing
+    library = HttpLibrary(create_session(cookies), libraries[worker].kind, record_dir)
+    library.open()
+    libraries[worker] = library
+
+def scrape_shard(libraries, worker, indices, results, recorder, cookies, record_dir=None):
+    kind = libraries[worker].kind
+    try:
+        logging.info(f"Scraping {kind} {indices[0] + 1} to {indices[-1] + 1} over HTTP")
+        run_with_retries(indices, lambda i: HTTP_SCRAPE_ITEM[kind](libraries[worker], i), results, recorder,
+                         lambda: recycle_library(libraries, worker, cookies, record_dir))
+    except Exception as e:
+        logging.error(f"Shard {indices[0] + 1} to {indices[-1] + 1} of {kind} stopped: {e}")
+        traceback.print_exc()
+    finally:
+        results.put(None)
+
+def scrape_library(kind, cookies, workers=1, record_dir=None, fresh=False, incremental=False, store=None, parquet=False):
+    logging.info(f"Scraping {kind} over HTTP...")
+
+    # Every worker holds its own view of the page, and so its own JSF view state
+    libraries = [HttpLibrary(create_session(cookies), kind, record_dir) for _ in range(workers)]
+    for library in libraries:
+        library.open()
+    items = libraries[0].list_items()
+    logging.info(f"Elements in list: {len(items)}")
+
+    return scrape.collect_library(kind, items, lambda worker, indices, results, recorder: scrape_shard(libraries, worker, indices, results, recorder, cookies, record_dir), workers, fresh, incremental, store, parquet)
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape the TOTEM libraries over HTTP, falling back to the browser")
+    parser.add_argument('--workers', type=int, default=1, help="number of parallel HTTP workers")
+    parser.add_argument('--cookies', help="JSON file with session cookies, skips the browser login")
+    parser.add_argument('--record', help="directory to record the page and partial responses to, for replay.py")
+    parser.add_argument('--fresh', action='store_true', help="ignore the progress journal of an interrupted run and start over")
+    parser.add_argument('--incremental', action='store_true', help="only scrape items that are new or changed since the last finished run")
+    parser.add_argument('--sqlite', help="also write the scraped rows to this SQLite database, see store.py")
+    parser.add_argument('--parquet', action='store_true', help="also write elements.parquet / components.parquet with typed columns")
+    scrape.add_browser_arguments(parser)
+    args = parser.parse_args()
+    browser = scrape.browser_options(args)
+
+    driver = None
+    store = scrape.open_store(args)
+    try:
+        if args.cookies:
+            with open(args.cookies) as file:
+                cookies = json.load(file)
+        else:
+            # A still valid cached session needs no browser at all
+            cookies = scrape.load_cached_cookies(browser['session_cache'])
+            if cookies is None:
+                driver = scrape.start_session(browser)
+                cookies = driver.get_cookies()
+
+        for kind in LIBRARIES:
+            try:
+                scrape_library(kind, cookies, args.workers, args.record, args.fresh, args.incremental, store, args.parquet)
+            except (UnsupportedPageError, requests.RequestException, RuntimeError) as e:
+                logging.warning(f"HTTP engine unavailable for {kind}, falling back to the browser: {e}")
+                if driver is None:
+                    driver = scrape.start_session(browser)
+                # The driver may be replaced when it degrades
+                sessions = [driver]
+                scrape.scrape_library(kind, sessions, args.fresh, args.incremental, store, args.parquet, browser)
+                driver = sessions[0]
+    except Exception as e:
+        logging.error(f"Fatal error occurred: {e}")
+        traceback.print_exc()
+    finally:
+        if driver is not None:
+            logging.info("Closing the driver")
+            driver.quit()
+        if store is not None:
+            store.close()
+
+if __name__ == '__main__':
+    main()